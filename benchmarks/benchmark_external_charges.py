@@ -0,0 +1,51 @@
+"""
+Benchmark of the time to set up the external point charges of 
+electrostatic embedding in Psi4 against the number of MM atoms in the box.
+For each box size, reports the time of set_up_psi4 for a water molecule 
+with the charges given as a list of [q, x, y, z] lists and as an (N,4) array.
+
+Run from the root of the repository:
+
+    python benchmarks/benchmark_external_charges.py
+"""
+import time
+import numpy as np
+from janus.qm_wrapper import Psi4Wrapper
+
+n_charges = [1000, 3000, 10000, 30000, 100000]
+n_calls = 5
+
+qm_mol = """O     0.123   3.593   5.841 
+ H    -0.022   2.679   5.599 
+ H     0.059   3.601   6.796 
+ """
+
+def time_per_call(charges):
+    """
+    Returns the time in seconds of one call to set_up_psi4 with the given charges
+    """
+
+    wrapper = Psi4Wrapper(basis='STO-3G')
+    wrapper.set_qm_geometry(qm_mol)
+    wrapper.external_charges = charges
+    wrapper.set_up_psi4()
+
+    start = time.perf_counter()
+    for i in range(n_calls):
+        wrapper.set_up_psi4()
+    return (time.perf_counter() - start)/n_calls
+
+if __name__ == '__main__':
+
+    np.random.seed(0)
+
+    print('{:>10} {:>12} {:>12}'.format('charges', 'list', 'array'))
+    for n in n_charges:
+        charges = np.zeros((n, 4))
+        charges[:, 0] = np.random.uniform(-0.8, 0.8, n)
+        # cubic box with the density of water
+        charges[:, 1:] = np.random.uniform(10, 10 + (n*10)**(1/3), (n, 3))
+
+        t_list = time_per_call(charges.tolist())
+        t_array = time_per_call(charges)
+        print('{:>10} {:>10.4f} s {:>10.4f} s'.format(n, t_list, t_array))
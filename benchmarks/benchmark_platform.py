@@ -0,0 +1,62 @@
+"""
+Benchmark of the per-step MM time for different OpenMM platforms 
+and thread counts. For each setting, reports the time of one MD step 
+of the system of interest and of one energy and gradient computation 
+of a small subsystem with a saved context.
+
+Run from the root of the repository:
+
+    python benchmarks/benchmark_platform.py
+"""
+import os
+import time
+import mdtraj as md
+import numpy as np
+from janus.mm_wrapper import OpenMMWrapper
+
+sys_info = 'tests/files/test_openmm/input.pdb'
+n_steps = 10
+
+settings = [('Reference', {}, {})]
+for threads in [1, 2, 4]:
+    if threads <= os.cpu_count():
+        settings.append(('CPU', {'Threads' : threads}, {'Threads' : 1}))
+
+def time_per_step(platform, platform_properties, subsystem_platform_properties):
+    """
+    Returns the time in seconds of one MD step of the system of interest 
+    and of one computation on a subsystem of 10 water molecules
+    """
+
+    wrapper = OpenMMWrapper(sys_info=sys_info, **{'md_ensemble':'NVT', 'return_info':[],
+                                                  'platform':platform,
+                                                  'platform_properties':platform_properties,
+                                                  'subsystem_platform_properties':subsystem_platform_properties})
+    wrapper.initialize('Mechanical')
+
+    start = time.perf_counter()
+    for i in range(n_steps):
+        wrapper.take_updated_step({})
+    main = (time.perf_counter() - start)/n_steps
+
+    traj = md.load(sys_info)
+    atoms = traj.topology.select('water')[:30].tolist()
+    traj_sub = traj.atom_slice(atoms)
+    wrapper.get_energy_and_gradient(traj_sub, atoms=atoms)
+
+    start = time.perf_counter()
+    for i in range(n_steps):
+        wrapper.get_energy_and_gradient(traj_sub, atoms=atoms)
+    sub = (time.perf_counter() - start)/n_steps
+
+    return main, sub
+
+if __name__ == '__main__':
+
+    results = []
+    for setting in settings:
+        results.append((setting,) + time_per_step(*setting))
+
+    print('{:>10} {:>20} {:>20} {:>12} {:>12}'.format('platform', 'main properties', 'subsystem properties', 'main/step', 'subsystem'))
+    for (platform, main_properties, sub_properties), main, sub in results:
+        print('{:>10} {:>20} {:>20} {:>10.4f} s {:>10.4f} s'.format(platform, str(main_properties), str(sub_properties), main, sub))
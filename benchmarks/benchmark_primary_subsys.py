@@ -0,0 +1,77 @@
+"""
+Benchmark of the time to make the trajectory of the primary subsystem
+of a partition, with link atoms, for partitions of a protein in water.
+Every partition is a window of consecutive residues, so its bonds to the
+rest of the protein are cut and link atoms are added. Reports the time per
+partition the first time a set of QM atoms is seen and when it is seen again,
+as happens for the partitions of adaptive QM/MM from step to step.
+
+Run from the root of the repository:
+
+    python benchmarks/benchmark_primary_subsys.py
+"""
+import io
+import time
+import contextlib
+import numpy as np
+from janus.qmmm import QMMM
+
+sys_info = 'tests/files/test_openmm/input.pdb'
+residues_per_partition = [1, 3, 10]
+n_partitions = 30
+n_steps = 5
+
+def make_partitions(qmmm, n_residues):
+    """
+    Returns the QM atoms of n_partitions windows of n_residues consecutive protein residues
+    """
+
+    residues = [res for res in qmmm.topology.residues if res.is_protein]
+    partitions = []
+    for i in range(n_partitions):
+        window = residues[i:i + n_residues]
+        partitions.append([atom.index for res in window for atom in res.atoms])
+    return partitions
+
+def time_per_partition(qmmm, partitions):
+    """
+    Returns the time in seconds to make the primary subsystem of one partition,
+    averaged over n_steps steps in which the atoms move
+    """
+
+    # the printed output of make_primary_subsys_trajectory is discarded
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for step in range(n_steps):
+            qmmm.positions += 0.001
+            for qm_atoms in partitions:
+                qmmm.make_primary_subsys_trajectory(qm_atoms)
+        end = time.perf_counter()
+
+    return (end - start)/(n_steps * len(partitions))
+
+if __name__ == '__main__':
+
+    # no cache, so every partition is made as if seen for the first time
+    uncached = QMMM(None, None, sys_info=sys_info, subsys_cache_size=0)
+    cached = QMMM(None, None, sys_info=sys_info)
+
+    results = []
+    for n in residues_per_partition:
+        partitions = make_partitions(cached, n)
+
+        # the bond index and scale factors are made by the first call
+        with contextlib.redirect_stdout(io.StringIO()):
+            uncached.make_primary_subsys_trajectory(partitions[0])
+        t_new = time_per_partition(uncached, partitions)
+        # fill the cache first, so every partition is seen again
+        with contextlib.redirect_stdout(io.StringIO()):
+            for qm_atoms in partitions:
+                cached.make_primary_subsys_trajectory(qm_atoms)
+        t_cached = time_per_partition(cached, partitions)
+
+        results.append((n, np.mean([len(p) for p in partitions]), t_new, t_cached))
+
+    print('{:>10} {:>10} {:>14} {:>14}'.format('residues', 'qm atoms', 'first time', 'seen again'))
+    for n, n_atoms, t_new, t_cached in results:
+        print('{:>10} {:>10.1f} {:>11.1f} us {:>11.1f} us'.format(n, n_atoms, t_new*1e6, t_cached*1e6))
@@ -0,0 +1,57 @@
+"""
+Benchmark of the fixed per-call overhead of Psi4 for small QM regions.
+For water clusters of increasing size, reports the time of setting up 
+a Psi4 computation with and without a persistent session, and the time 
+of a full energy and gradient computation, so the share of the set up 
+in each call can be compared.
+
+Run from the root of the repository:
+
+    python benchmarks/benchmark_psi4_session.py
+"""
+import time
+import mdtraj as md
+import numpy as np
+from janus.qm_wrapper import Psi4Wrapper
+
+sys_info = 'tests/files/test_openmm/input.pdb'
+n_calls = 10
+n_waters = [1, 2, 4, 8]
+
+param = {'basis' : 'STO-3G', 'scf_type' : 'df', 'e_convergence' : 1e-8, 'd_convergence' : 1e-8}
+
+def time_per_call(persistent_session, qm_traj, charges):
+    """
+    Returns the time in seconds of one call to set_up_psi4 
+    and of one energy and gradient computation
+    """
+
+    wrapper = Psi4Wrapper(persistent_session=persistent_session, **dict(param))
+    wrapper.get_energy_and_gradient(traj=qm_traj, charges=charges)
+
+    start = time.perf_counter()
+    for i in range(n_calls):
+        wrapper.set_up_psi4()
+    set_up = (time.perf_counter() - start)/n_calls
+
+    start = time.perf_counter()
+    for i in range(n_calls):
+        wrapper.get_energy_and_gradient(traj=qm_traj, charges=charges)
+    total = (time.perf_counter() - start)/n_calls
+
+    return set_up, total
+
+if __name__ == '__main__':
+
+    traj = md.load(sys_info)
+    waters = [[a.index for a in r.atoms] for r in traj.topology.residues if r.is_water]
+    # point charges of the next 20 waters
+    charges = [[-0.834, *(10*traj.xyz[0][a])] if traj.topology.atom(a).element.symbol == 'O' 
+               else [0.417, *(10*traj.xyz[0][a])] for r in waters[max(n_waters):max(n_waters)+20] for a in r]
+
+    print('{:>8} {:>10} {:>14} {:>14} {:>10}'.format('waters', 'session', 'set up/call', 'total/call', 'set up %'))
+    for n in n_waters:
+        qm_traj = traj.atom_slice(np.concatenate(waters[:n]))
+        for persistent_session in [False, True]:
+            set_up, total = time_per_call(persistent_session, qm_traj, charges)
+            print('{:>8} {:>10} {:>12.4f} s {:>12.4f} s {:>9.1f}%'.format(n, str(persistent_session), set_up, total, 100*set_up/total))
@@ -0,0 +1,51 @@
+"""
+Benchmark for loading the OpenMM system of the entire system
+from a saved snapshot instead of creating it with createSystem.
+
+Run from the root of the repository:
+
+    python benchmarks/benchmark_system_cache.py
+"""
+import os
+import time
+import tempfile
+from janus.mm_wrapper import OpenMMWrapper
+
+systems = ['tests/files/test_openmm/water.pdb',
+           'tests/files/test_openmm/ala_water.pdb',
+           'tests/files/test_openmm/input.pdb']
+
+def time_setup(sys_info, system_cache_file=None, repeats=5):
+    """
+    Times creating a wrapper and the OpenMM system of the entire system,
+    as done when a simulation is initialized or restarted.
+    Returns the best time in seconds.
+    """
+
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        wrapper = OpenMMWrapper(sys_info=sys_info, **{'md_ensemble':'NVT', 'return_info':[], 
+                                                      'system_cache_file':system_cache_file})
+        wrapper.create_openmm_system(wrapper.topology, initialize=True)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+if __name__ == '__main__':
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for sys_info in systems:
+            cache_file = os.path.join(tmp, os.path.basename(sys_info) + '.pkl')
+
+            no_cache = time_setup(sys_info)
+            # the first run creates the snapshot, later runs load it
+            time_setup(sys_info, cache_file, repeats=1)
+            cache = time_setup(sys_info, cache_file)
+
+            results.append((os.path.basename(sys_info), no_cache, cache))
+
+    print('{:>16} {:>14} {:>14} {:>9}'.format('system', 'createSystem/s', 'snapshot/s', 'speedup'))
+    for name, no_cache, cache in results:
+        print('{:>16} {:>14.4f} {:>14.4f} {:>9.2f}'.format(name, no_cache, cache, no_cache/cache))
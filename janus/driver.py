@@ -25,10 +25,12 @@ def run_janus(filename='input.json'):
     # initialize wrappers
     ll_wrapper, qmmm_wrapper = initializer.initialize_wrappers()
 
-    if initializer.run_md is True:
-        run_simulation(ll_wrapper, qmmm_wrapper)
-    else:
-        run_single_point(ll_wrapper, qmmm_wrapper)
+    # stops the worker processes of the QM computations when done
+    with qmmm_wrapper:
+        if initializer.run_md is True:
+            run_simulation(ll_wrapper, qmmm_wrapper)
+        else:
+            run_single_point(ll_wrapper, qmmm_wrapper)
 
 def run_simulation(md_sim_wrapper, qmmm_wrapper):
     """
@@ -82,8 +84,8 @@ def run_single_point(ll_wrapper, qmmm_wrapper):
         A QMMM or AQMMM wrapper that drives the QM/MM computations
 
     """
-    #get MM information for entire system
-    main_info = ll_wrapper.get_main_info()
+    #get MM information for entire system, without the qmmm force if the QM/MM wrapper uses it
+    main_info = ll_wrapper.get_main_info(include_mm=qmmm_wrapper.use_main_info)
 
     qmmm_wrapper.run_qmmm(main_info, ll_wrapper.class_type)
 
@@ -1,6 +1,6 @@
 import json
 import os
-from janus.qm_wrapper import Psi4Wrapper 
+from janus.qm_wrapper import Psi4Wrapper, AnalyticWrapper
 from janus.mm_wrapper import OpenMMWrapper 
 from janus.qmmm import QMMM, OniomXS, HotSpot, PAP, SAP, DAS
 
@@ -65,11 +65,15 @@ class Initializer(object):
         """
 
         if self.hl_program == "Psi4":
+            if Psi4Wrapper is None:
+                raise ImportError("Psi4 needs to be installed to be used in high level computations")
             self.hl_wrapper = Psi4Wrapper
         elif self.hl_program == "OpenMM":
             self.hl_wrapper = OpenMMWrapper
+        elif self.hl_program == "Analytic":
+            self.hl_wrapper = AnalyticWrapper
         else:
-            raise ValueError("Only Psi4 and OpenMM currently available to be used in high level computations")
+            raise ValueError("Only Psi4, OpenMM and Analytic currently available to be used in high level computations")
 
         if self.ll_program == "OpenMM":
             self.ll_wrapper = OpenMMWrapper
@@ -45,7 +45,7 @@ class MMWrapper(ABC):
 
         super().__init__()
 
-    def get_energy_and_gradient(self, traj, geometry=None, include_coulomb='all', link_atoms=None, minimize=False, charges=None):
+    def get_energy_and_gradient(self, traj, geometry=None, include_coulomb='all', link_atoms=None, minimize=False, charges=None, atoms=None):
         """
         Gets the energy and gradient from a MM computation
 
@@ -68,6 +68,10 @@ class MMWrapper(ABC):
             whether to return the geometry optimized energy 
         charges : list
             charges and corresponding positions in angstroms as xyz coordinates
+        atoms : list
+            indices in the entire system of the atoms contained in traj. 
+            If given, the objects built for this system are kept and reused
+            in later calls with the same atoms. Default is None.
 
         Returns
         -------
@@ -76,15 +80,42 @@ class MMWrapper(ABC):
              
         """
 
-        topology, positions = self.convert_trajectory(traj)
+        if self.is_simulation_saved(atoms, link_atoms, minimize):
+            # a saved simulation only needs the positions in nm, not the topology
+            topology, positions = None, traj.xyz[0]
+        else:
+            topology, positions = self.convert_trajectory(traj)
 
         if charges is not None:
             self.set_external_charges(charges)
 
-        info = self.compute_info(topology, positions, include_coulomb=include_coulomb, link_atoms=link_atoms, minimize=minimize)
+        info = self.compute_info(topology, positions, include_coulomb=include_coulomb, link_atoms=link_atoms, minimize=minimize, atoms=atoms)
 
         return info
 
+    def is_simulation_saved(self, atoms, link_atoms=None, minimize=False):
+        """
+        Whether a simulation is saved for a set of atoms, in which case 
+        :func:`~janus.mm_wrapper.MMWrapper.get_energy_and_gradient` 
+        does not convert the topology of the trajectory. 
+        Wrappers that do not save simulations return False
+
+        Parameters
+        ----------
+        atoms : list
+            indices in the entire system of the atoms in the trajectory
+        link_atoms : list
+            indices of link_atoms
+        minimize : bool
+            whether the geometry optimized energy is computed
+
+        Returns
+        -------
+        bool
+        """
+
+        return False
+
     def post_processing_input(self):
 
         self.qmmm_steps = self.end_qmmm - self.start_qmmm
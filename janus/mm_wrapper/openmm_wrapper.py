@@ -3,9 +3,14 @@ import simtk.openmm as OM
 import simtk.unit as OM_unit
 from mdtraj.reporters import NetCDFReporter
 from janus.mm_wrapper import MMWrapper
+from janus.system import ForceBuffer
 import numpy as np
 import pickle
 from copy import deepcopy
+from collections import OrderedDict
+import xml.etree.ElementTree as ET
+import os
+import hashlib
 
 class OpenMMWrapper(MMWrapper):
     """
@@ -57,6 +62,30 @@ class OpenMMWrapper(MMWrapper):
                             default is empty dict {}
         - switchDistance : the distance to turn on potential energy switching function for 
                             Lennard-Jones interactions. Default is None
+        - simulation_cache_size : the maximum number of simulations kept for reuse 
+                                  by :func:`~janus.mm_wrapper.OpenMMWrapper.compute_info`, 
+                                  the least recently used simulation is removed when exceeded. 
+                                  Default is 10
+        - residue_template_file : name of a forcefield xml file in which the residue templates 
+                                  generated by :func:`~janus.mm_wrapper.OpenMMWrapper.create_new_residue_template` 
+                                  are saved, and from which they are loaded in later runs. 
+                                  Default is None, which does not save templates
+        - system_cache_file : name of a file in which the OpenMM system of the entire system 
+                              is saved, together with a hash of the inputs it is made from. 
+                              If the hash of the current inputs is the same, later runs 
+                              and restarts load the system from this file instead of creating it.
+                              Default is None, which does not save the system
+        - platform : name of the OpenMM platform to use for all simulations, 
+                     e.g. 'Reference' or 'CPU'. Default is None, which lets OpenMM choose
+        - platform_properties : properties of the platform for the simulation of the system of interest,
+                                e.g. {'Threads' : '4', 'DeterministicForces' : 'true'} for the CPU platform. 
+                                Only used if platform is given. Default is empty dict {}
+        - subsystem_platform_properties : properties of the platform for all other simulations, 
+                                          such as those of subsystems. Default is None, which uses platform_properties
+        - slice_main_system : whether the OpenMM systems of subsystems are built by extracting
+                              the parameters of their atoms from the OpenMM system of the entire
+                              system instead of calling createSystem. Subsystems with link atoms 
+                              still call createSystem. Default is False
         - keywords for MD simulation parameters.
             For possible keywords consult the Molecular Dynamics section of the manual. 
 
@@ -100,6 +129,13 @@ class OpenMMWrapper(MMWrapper):
         self.removeCMMotion=True
         self.flexibleConstraints=False 
         self.ignoreExternalBonds=True
+        self.slice_main_system=False
+        self.simulation_cache_size=10
+        self.residue_template_file=None
+        self.system_cache_file=None
+        self.platform=None
+        self.platform_properties={}
+        self.subsystem_platform_properties=None
 
         openmm_param = ['nonbondedMethod', 'constraints', 'hydrogenMass', 'switchDistance', 'residueTemplates']
 
@@ -118,6 +154,25 @@ class OpenMMWrapper(MMWrapper):
 
         self.positions = None
 
+        # serialized OpenMM system of the entire system, see load_system_snapshot
+        self.system_snapshot = None
+
+        # template name for each residue signature seen, None if the forcefield matches the residue itself
+        self.residue_signatures = {}
+        self.generated_templates = []
+
+        # long-lived simulations, keyed by the atoms they contain, the link atoms, and the coulomb treatment, 
+        # ordered from least to most recently used
+        self.simulations = OrderedDict()
+        self.simulation_cache_info = {'hits' : 0, 'misses' : 0, 'evictions' : 0}
+        # force group of the external qmmm force in the main simulation
+        self.qmmm_force_group = 31
+        # force groups of saved simulations, see add_coulomb_variants
+        self.bonded_force_group = 1
+        self.nonbonded_force_group = 2
+        # parameterized system of the entire system, used to build subsystems
+        self.main_system = None
+
         self.convert_input()
 
     def initialize(self, embedding_method):
@@ -149,7 +204,7 @@ class OpenMMWrapper(MMWrapper):
                     integrator = self.NVE_integrator
 
                 OM_system = self.create_openmm_system(self.topology)
-                simulation, integrator_obj = self.create_openmm_simulation(OM_system, self.topology, self.positions, integrator, return_integrator=True)
+                simulation, integrator_obj = self.create_openmm_simulation(OM_system, self.topology, self.positions, integrator, return_integrator=True, main=True)
                 simulation.minimizeEnergy()
 
                 #simulation.reporters.append(NetCDFReporter('output_nvt.nc', 50))
@@ -190,7 +245,7 @@ class OpenMMWrapper(MMWrapper):
 
         print(self.integrator)
         # Create an OpenMM simulation from the openmm system, topology, and positions.
-        self.main_simulation = self.create_openmm_simulation(OM_system, self.topology, self.positions, self.integrator)
+        self.main_simulation = self.create_openmm_simulation(OM_system, self.topology, self.positions, self.integrator, main=True)
 
         with open(chkpt_file, 'rb') as f:
             self.main_simulation.context.loadCheckpoint(f.read())
@@ -226,8 +281,8 @@ class OpenMMWrapper(MMWrapper):
 
         Parameters
         ----------
-        force : dict 
-            forces(particle index : forces) in au/bohr to 
+        force : :class:`~janus.system.ForceBuffer` or dict 
+            forces in au/bohr, or dictionary of forces(particle index : forces), to 
             be updated in custom qmmm force and fed into simulation
 
         """
@@ -242,46 +297,52 @@ class OpenMMWrapper(MMWrapper):
 
     def update_forces(self, forces, force_obj, simulation):
         """
-        Updates a simulation with external forces 
+        Updates a simulation with external forces.
+
+        Only the particles that have been given external forces are in force_obj, 
+        each as a term with its own slot in the tables of forces fx, fy, and fz, 
+        so the cost of an update scales with the number of these particles 
+        rather than the system size. The slot of each particle is saved 
+        in self.qmmm_slots, -1 for particles without a slot. The tables are 
+        set as whole arrays, with zeros in the slots of particles that 
+        do not have forces now, and updated with one call to updateParametersInContext.
+        OpenMM cannot change the particle of a term in a context, so a particle 
+        keeps its slot once it has one, and the context is only reinitialized 
+        when particles that never had forces before are given forces.
 
         Parameters
         ----------
-        force : dict 
-            forces(particle index : forces) in au/bohr to 
+        force : :class:`~janus.system.ForceBuffer` or dict 
+            forces in au/bohr, or dictionary of forces(particle index : forces), to 
             be updated in a force object  and fed into simulation
-        force_obj : OpenMM Force object
-            the force object to add the forces to. Can be built in or custom
+        force_obj : OpenMM CustomCompoundBondForce object
+            the force object to add the forces to, as made by 
+            :func:`~janus.mm_wrapper.OpenMMWrapper.create_openmm_system`
         simulation : OpenMM simulation object
             where the forces are to be updated in
         
         """
 
-        current = OpenMMWrapper.get_state_info(self.main_simulation,
-                                                energy=False,
-                                                positions=False,
-                                                forces=True)
-        #for f in range(len(current['forces'])):
-        #    print(f, current['forces'][f])
-
-        for f, coord in forces.items():
-            coord *= MMWrapper.au_bohr_to_kjmol_nm             # convert this back to openmm units
-            #print('fed in forces')
-            #print(f, coord)
-            #print('forces from before')
-            #print(current['forces'][f])
-            #coord -= current['forces'][f]
-            #print('new forces')
-            #print(coord)
-            force_obj.setParticleParameters(f, f, coord)  # need to figure out if the first 2 parameters always the same or not
-            
+        forces = ForceBuffer.from_forces(forces)
+        particles = forces.indices
+
+        # add slots for the particles that never had forces
+        new = particles[self.qmmm_slots[particles] < 0]
+        start = force_obj.getNumBonds()
+        for i, f in enumerate(new.tolist()):
+            force_obj.addBond([f], [float(start + i)])
+        self.qmmm_slots[new] = np.arange(start, start + len(new))
 
-        force_obj.updateParametersInContext(simulation.context)  # update forces with qmmm force
-        #current2 = OpenMMWrapper.get_state_info(self.main_simulation,
-        #                                        energy=False,
-        #                                        positions=False,
-        #                                        forces=True)
-        #for f in range(len(current2['forces'])):
-        #    print(f, current2['forces'][f])
+        # convert this back to openmm units
+        values = np.zeros((max(force_obj.getNumBonds(), 1), 3))
+        values[self.qmmm_slots[particles]] = forces.forces * MMWrapper.au_bohr_to_kjmol_nm
+        for k in range(3):
+            force_obj.getTabulatedFunction(k).setFunctionParameters(values[:, k].tolist())
+
+        if len(new) > 0:
+            simulation.context.reinitialize(preserveState=True)
+        else:
+            force_obj.updateParametersInContext(simulation.context)  # update forces with qmmm force
 
     def take_step(self, num):
         """
@@ -296,12 +357,21 @@ class OpenMMWrapper(MMWrapper):
         if num != 0:
             self.main_simulation.step(num)
 
-    def get_main_info(self):
+    def get_main_info(self, include_mm=False):
         """
         Gets the information for the system of interest.
         Calls :func:`~janus.mm_wrapper.OpenMMWrapper.get_state_info`
         to obtain information.
 
+        Parameters
+        ----------
+        include_mm : bool
+            Whether to also include the MM potential energy, forces and gradients 
+            of the system without the contribution of the external qmmm force, 
+            as 'mm_potential', 'mm_forces', and 'mm_gradients'. These take 
+            another evaluation of the forces, so they are only computed if asked for. 
+            Default is False.
+
         Returns
         -------
         dict
@@ -310,16 +380,33 @@ class OpenMMWrapper(MMWrapper):
     
         """
         
-        return OpenMMWrapper.get_state_info(self.main_simulation, main_info=True)
+        info = OpenMMWrapper.get_state_info(self.main_simulation, main_info=True)
+
+        if include_mm is False:
+            return info
 
-    def compute_info(self, topology, positions, include_coulomb='all', initialize=False, return_system=False, return_simulation=False, link_atoms=None, minimize=False):
+        # the qmmm force is in its own force group, so its contribution can be removed
+        qmmm = OpenMMWrapper.get_state_info(self.main_simulation,
+                                            energy=True,
+                                            positions=False,
+                                            forces=True,
+                                            groups_included={self.qmmm_force_group})
+
+        info['mm_potential'] = info['potential'] - qmmm['potential']
+        info['mm_forces'] = info['forces'] - qmmm['forces']
+        info['mm_gradients'] = info['gradients'] - qmmm['gradients']
+
+        return info
+
+    def compute_info(self, topology, positions, include_coulomb='all', initialize=False, return_system=False, return_simulation=False, link_atoms=None, minimize=False, atoms=None):
         """
         Gets information about a system. 
 
         Parameters
         ----------
         topology : OpenMM topology object
-        positions : OpenMM Vec3 vector 
+            not used, and may be None, if a simulation is saved for atoms
+        positions : OpenMM Vec3 vector or numpy array
             contains the positions of the system in nm
         include_coulomb : str
             whether to include coulombic interactions. 
@@ -338,6 +425,20 @@ class OpenMMWrapper(MMWrapper):
             atoms to remove coulombic forces from. Default is None.
         minimize : bool
             whether to minimize the energy of the system
+        atoms : list
+            indices in the entire system of the atoms in topology, 
+            with link atoms given the index of the MM atom they replace.
+            If given, the simulation created for these atoms and link_atoms 
+            is saved in self.simulations, and later calls with the same atoms 
+            only update the positions of the saved simulation. The saved simulation 
+            gives every include_coulomb option, 
+            see :func:`~janus.mm_wrapper.OpenMMWrapper.add_coulomb_variants`. 
+            At most self.simulation_cache_size simulations are saved, 
+            see :func:`~janus.mm_wrapper.OpenMMWrapper.get_simulation_cache_info`. 
+            If self.slice_main_system is True, 
+            the OpenMM system is built with 
+            :func:`~janus.mm_wrapper.OpenMMWrapper.create_openmm_subsystem`.
+            Default is None.
 
         Returns
         -------
@@ -355,15 +456,43 @@ class OpenMMWrapper(MMWrapper):
         >>> state = compute_info(top, pos, return_simulation=False, return_system=False)
         """
 
-        # ensure every computation has same periodic box vector parameters
-        topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
-        # Create an OpenMM system from an object's topology
-        print('topology going into system')
-        print(topology.getNumAtoms())
-        OM_system = self.create_openmm_system(topology, include_coulomb, link_atoms,initialize=initialize)
+        key = self.get_simulation_key(atoms, link_atoms, initialize, minimize)
 
-        # Create an OpenMM simulation from the openmm system, topology, and positions.
-        simulation = self.create_openmm_simulation(OM_system, topology, positions, self.integrator)
+        if key in self.simulations:
+            # reuse the existing context, only the positions have changed
+            self.simulation_cache_info['hits'] += 1
+            self.simulations.move_to_end(key)
+            simulation = self.simulations[key]
+            simulation.context.setPositions(positions)
+            OM_system = simulation.system
+
+        else:
+            # ensure every computation has same periodic box vector parameters
+            topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
+            # Create an OpenMM system from an object's topology
+            print('topology going into system')
+            print(topology.getNumAtoms())
+            # a saved system includes all coulombic interactions, the other options are given by add_coulomb_variants
+            system_coulomb = 'all' if key is not None else include_coulomb
+
+            if (self.slice_main_system is True and atoms is not None and initialize is False):
+                OM_system = self.create_openmm_subsystem(topology, atoms, system_coulomb, link_atoms)
+            else:
+                OM_system = self.create_openmm_system(topology, system_coulomb, link_atoms,initialize=initialize)
+
+            if key is not None:
+                self.add_coulomb_variants(OM_system, link_atoms)
+
+            # Create an OpenMM simulation from the openmm system, topology, and positions.
+            simulation = self.create_openmm_simulation(OM_system, topology, positions, self.integrator, main=initialize)
+
+            if key is not None:
+                self.simulation_cache_info['misses'] += 1
+                self.simulations[key] = simulation
+                # remove the least recently used simulations
+                while len(self.simulations) > self.simulation_cache_size:
+                    self.simulations.popitem(last=False)
+                    self.simulation_cache_info['evictions'] += 1
 
         if minimize is True:
             simulation.minimizeEnergy()
@@ -372,11 +501,16 @@ class OpenMMWrapper(MMWrapper):
         # set up reporters
             self.set_up_reporters(simulation) 
 
+        groups = -1
+        if key is not None:
+            groups = self.set_coulomb_variant(simulation, include_coulomb)
+
         # Calls openmm wrapper to get information specified
         state = OpenMMWrapper.get_state_info(simulation,
                                       energy=True,
                                       positions=True,
-                                      forces=True)
+                                      forces=True,
+                                      groups_included=groups)
 
         if return_system is True and return_simulation is True:
             return OM_system, simulation, state
@@ -388,6 +522,81 @@ class OpenMMWrapper(MMWrapper):
             return state
 
 
+    def get_simulation_key(self, atoms, link_atoms=None, initialize=False, minimize=False):
+        """
+        Gets the key under which the simulation of a set of atoms 
+        is saved in self.simulations
+
+        Parameters
+        ----------
+        atoms : list
+            indices in the entire system of the atoms in the simulation
+        link_atoms : list
+            indices of link atoms. Default is None.
+        initialize : bool 
+            Whether the main system is being initialized.
+        minimize : bool
+            whether the energy of the system is minimized
+
+        Returns
+        -------
+        tuple
+            None if the simulation is not saved
+        """
+
+        if (atoms is None or self.simulation_cache_size <= 0 or initialize is True or minimize is True):
+            return None
+
+        return (tuple(atoms), tuple(link_atoms) if link_atoms else None)
+
+    def is_simulation_saved(self, atoms, link_atoms=None, minimize=False):
+        """
+        Whether a simulation is saved in self.simulations for a set of atoms, 
+        see :func:`~janus.mm_wrapper.OpenMMWrapper.get_simulation_key`. 
+        If so, :func:`~janus.mm_wrapper.MMWrapper.get_energy_and_gradient` 
+        only passes the positions of the trajectory to 
+        :func:`~janus.mm_wrapper.OpenMMWrapper.compute_info`, 
+        without converting its topology
+
+        Parameters
+        ----------
+        atoms : list
+            indices in the entire system of the atoms in the trajectory
+        link_atoms : list
+            indices of link atoms
+        minimize : bool
+            whether the energy of the system is minimized
+
+        Returns
+        -------
+        bool
+        """
+
+        key = self.get_simulation_key(atoms, link_atoms, minimize=minimize)
+        return (key is not None and key in self.simulations)
+
+    def get_simulation_cache_info(self):
+        """
+        Gets the number of times a saved simulation was reused (hits),
+        a simulation had to be created (misses), and a saved simulation 
+        was removed because the cache was full (evictions)
+
+        Returns
+        -------
+        dict
+            Keys include 'hits', 'misses', 'evictions', 'size', and 'max_size'
+    
+        Examples
+        --------
+        >>> info = get_simulation_cache_info()
+        """
+
+        info = dict(self.simulation_cache_info)
+        info['size'] = len(self.simulations)
+        info['max_size'] = self.simulation_cache_size
+
+        return info
+
     def create_openmm_system(self, topology, include_coulomb='all', link_atoms=None, initialize=False):
         """
         Calls OpenMM to create an OpenMM System object give a topology,
@@ -426,18 +635,23 @@ class OpenMMWrapper(MMWrapper):
         openmm_sys = create_openmm_system(top, initialize=True)
         """
 
+        openmm_system = None
+        if (self.system_cache_file is not None and topology is self.topology):
+            openmm_system = self.load_system_snapshot()
+
+        if openmm_system is not None:
+            print('using saved snapshot of the system')
+
         # check to see if there are unmatched residues in pdb, create residue templates if there are
-        if (self.system_info_format == 'pdb' or self.use_pdb is True):
-            unmatched = self.forcefield.getUnmatchedResidues(topology)
-            if unmatched:
-                self.create_new_residue_template(topology)
+        elif (self.system_info_format == 'pdb' or self.use_pdb is True):
+            residue_templates = self.get_residue_templates(topology)
 
             openmm_system = self.forcefield.createSystem(topology,
                                             nonbondedMethod=self.nonbondedMethod,
                                             constraints=self.constraints,
                                             hydrogenMass=self.hydrogenMass,
                                             switchDistance=self.switchDistance,
-                                            residueTemplates=self.residueTemplates,
+                                            residueTemplates=residue_templates,
                                             nonbondedCutoff=self.nonbondedCutoff,
                                             rigidWater=self.rigid_water,
                                             removeCMMotion=self.removeCMMotion,
@@ -465,19 +679,120 @@ class OpenMMWrapper(MMWrapper):
             print('new system particles')
             print(openmm_system.getNumParticles())
 
+        if (self.system_cache_file is not None and topology is self.topology and self.system_snapshot is None):
+            self.save_system_snapshot(openmm_system)
+
         if initialize is True:                                             # this is for the initialization of the entire system
-            self.qmmm_force = OM.CustomExternalForce("-x*fx-y*fy-z*fz")    # define a custom force for adding qmmm gradients
-            self.qmmm_force.addPerParticleParameter('fx')
-            self.qmmm_force.addPerParticleParameter('fy')
-            self.qmmm_force.addPerParticleParameter('fz')
+            # define a custom force for adding qmmm gradients, with the forces on 
+            # the particle of each term in the tables fx, fy, and fz at the term's slot
+            self.qmmm_force = OM.CustomCompoundBondForce(1, "-x1*fx(slot)-y1*fy(slot)-z1*fz(slot)")
+            self.qmmm_force.addPerBondParameter('slot')
+            for name in ['fx', 'fy', 'fz']:
+                self.qmmm_force.addTabulatedFunction(name, OM.Discrete1DFunction([0.0]))
+            self.qmmm_force.setForceGroup(self.qmmm_force_group)
             
-            for i in range(openmm_system.getNumParticles()):
-                self.qmmm_force.addParticle(i, np.array([0.0, 0.0, 0.0]))
+            # particles are only added when they are given forces, see update_forces
+            self.qmmm_slots = np.full(openmm_system.getNumParticles(), -1, dtype=int)
             
             openmm_system.addForce(self.qmmm_force)
 
             self.main_charges = [openmm_system.getForce(3).getParticleParameters(i)[0]/OM_unit.elementary_charge for i in range(openmm_system.getNumParticles())]
 
+        self.set_coulomb(openmm_system, include_coulomb, link_atoms)
+
+        return openmm_system
+
+    def get_input_hash(self):
+        """
+        Gets a hash of everything the OpenMM system of the entire system
+        is made from: the input files, the forcefields, the options 
+        passed to createSystem, and the OpenMM version
+
+        Returns
+        -------
+        str
+            the hash as a hexadecimal string
+        """
+
+        files = self.system_info if type(self.system_info) is list else [self.system_info]
+        files = files + [self.ff, self.ff_water, self.residue_template_file]
+
+        options = [self.system_info_format, self.ff, self.ff_water, self.nonbondedMethod, self.nonbondedCutoff, 
+                   self.constraints, self.hydrogenMass, self.switchDistance, self.rigid_water, self.removeCMMotion, 
+                   self.flexibleConstraints, self.ignoreExternalBonds, OM.Platform.getOpenMMVersion()]
+
+        input_hash = hashlib.sha256(repr(options).encode())
+        for fil in files:
+            # forcefields included with OpenMM are covered by the version
+            if (fil is not None and os.path.isfile(fil)):
+                with open(fil, 'rb') as f:
+                    input_hash.update(f.read())
+
+        return input_hash.hexdigest()
+
+    def load_system_snapshot(self):
+        """
+        Loads the OpenMM system of the entire system from 
+        self.system_cache_file, if the file was made from the same inputs, 
+        see :func:`~janus.mm_wrapper.OpenMMWrapper.get_input_hash`.
+        The serialized system is kept in memory after it is first read.
+
+        Returns
+        -------
+        OpenMM system object
+            None if there is no snapshot for the current inputs
+        """
+
+        if (self.system_snapshot is None and os.path.isfile(self.system_cache_file)):
+            with open(self.system_cache_file, 'rb') as f:
+                snapshot = pickle.load(f)
+
+            if snapshot['input_hash'] == self.get_input_hash():
+                print('loading system snapshot from {}'.format(self.system_cache_file))
+                self.system_snapshot = snapshot['system']
+            else:
+                print('inputs changed, not using system snapshot from {}'.format(self.system_cache_file))
+
+        if self.system_snapshot is None:
+            return None
+
+        return OM.XmlSerializer.deserialize(self.system_snapshot)
+
+    def save_system_snapshot(self, openmm_system):
+        """
+        Saves the OpenMM system of the entire system to 
+        self.system_cache_file, together with a hash of the inputs, 
+        see :func:`~janus.mm_wrapper.OpenMMWrapper.get_input_hash`
+
+        Parameters
+        ----------
+        openmm_system : OpenMM system object
+        """
+
+        self.system_snapshot = OM.XmlSerializer.serialize(openmm_system)
+
+        with open(self.system_cache_file, 'wb') as f:
+            pickle.dump({'input_hash' : self.get_input_hash(), 'system' : self.system_snapshot}, f)
+
+    def set_coulomb(self, openmm_system, include_coulomb='all', link_atoms=None):
+        """
+        Modifies an OpenMM system according to which
+        coulombic interactions are to be included
+
+        Parameters
+        ----------
+        openmm_system : OpenMM system object
+        include_coulomb : str
+            whether to include coulombic interactions. 
+            'all' (default) includes coulombic forces for all particles,
+            'no_link' excludes coulombic forces for link atoms,
+            'only' excludes all other forces for all atoms,
+            'none' excludes coulombic forces for all particles.
+        link_atoms : list
+            if included as a list with include_coulomb='no_link', specifies which 
+            atoms to remove coulombic forces from. Default is None.
+        """
+
         # If in electrostatic embedding scheme need to get a system without coulombic interactions
         if include_coulomb == 'none':
             # get the nonbonded force
@@ -493,6 +808,257 @@ class OpenMMWrapper(MMWrapper):
                     openmm_system.removeForce(0)                              
             self.set_LJ_zero(openmm_system)
 
+    def add_coulomb_variants(self, openmm_system, link_atoms=None):
+        """
+        Sets up an OpenMM system so that all include_coulomb options 
+        can be computed from the same context. The nonbonded forces are put 
+        in the force group self.nonbonded_force_group and all other forces 
+        in self.bonded_force_group. Global parameters of the nonbonded force 
+        with particle parameter offsets remove the charges of all particles 
+        ('coulomb_off'), the charges of link atoms, or of all particles 
+        if there are no link atoms ('link_coulomb_off'), 
+        or the Lennard-Jones interactions ('lj_off') when set to 1, 
+        in the same way as :func:`~janus.mm_wrapper.OpenMMWrapper.set_charge_zero` 
+        and :func:`~janus.mm_wrapper.OpenMMWrapper.set_LJ_zero`.
+        Use :func:`~janus.mm_wrapper.OpenMMWrapper.set_coulomb_variant` to choose an option.
+
+        Parameters
+        ----------
+        openmm_system : OpenMM system object
+            a system with all coulombic interactions
+        link_atoms : list
+            indices of link atoms. Default is None.
+        """
+
+        # like set_charge_zero, without link atoms 'no_link' removes the charges of all particles
+        link_atoms = set(link_atoms) if link_atoms else None
+
+        for force in openmm_system.getForces():
+            if type(force) is OM.NonbondedForce:
+                force.setForceGroup(self.nonbonded_force_group)
+                force.addGlobalParameter('coulomb_off', 0.0)
+                force.addGlobalParameter('link_coulomb_off', 0.0)
+                force.addGlobalParameter('lj_off', 0.0)
+                for i in range(force.getNumParticles()):
+                    charge, sigma, epsilon = force.getParticleParameters(i)
+                    force.addParticleParameterOffset('coulomb_off', i, -charge, 0.0, 0.0)
+                    force.addParticleParameterOffset('lj_off', i, 0.0, 0.0, -epsilon)
+                    if (link_atoms is None or i in link_atoms):
+                        force.addParticleParameterOffset('link_coulomb_off', i, -charge, 0.0, 0.0)
+            else:
+                force.setForceGroup(self.bonded_force_group)
+
+    def set_coulomb_variant(self, simulation, include_coulomb='all'):
+        """
+        Chooses which coulombic interactions are included in a simulation 
+        set up by :func:`~janus.mm_wrapper.OpenMMWrapper.add_coulomb_variants`
+
+        Parameters
+        ----------
+        simulation : OpenMM simulation object
+        include_coulomb : str
+            whether to include coulombic interactions. 
+            'all' (default) includes coulombic forces for all particles,
+            'no_link' excludes coulombic forces for link atoms,
+            'only' excludes all other forces for all atoms,
+            'none' excludes coulombic forces for all particles.
+
+        Returns
+        -------
+        set
+            the force groups to include when getting the state, 
+            to be used as groups_included in 
+            :func:`~janus.mm_wrapper.OpenMMWrapper.get_state_info`
+        """
+
+        simulation.context.setParameter('coulomb_off', 1.0 if include_coulomb == 'none' else 0.0)
+        simulation.context.setParameter('link_coulomb_off', 1.0 if include_coulomb == 'no_link' else 0.0)
+        simulation.context.setParameter('lj_off', 1.0 if include_coulomb == 'only' else 0.0)
+
+        if include_coulomb == 'only':
+            return {self.nonbonded_force_group}
+        else:
+            return {self.bonded_force_group, self.nonbonded_force_group}
+
+    def get_main_system(self):
+        """
+        Gets the OpenMM system of the entire system, from which
+        the parameters of subsystems are extracted. The system is only
+        created once, and the terms of each supported force are indexed
+        by the atoms they involve, so that building a subsystem
+        only requires looking at the atoms of the subsystem.
+
+        Returns
+        -------
+        OpenMM system object
+        """
+
+        if self.main_system is None:
+            self.topology.setPeriodicBoxVectors(self.PeriodicBoxVector)
+            self.main_system = self.create_openmm_system(self.topology)
+
+            # for each force, the parameters of each term and the terms each atom is in
+            self.main_system_terms = []
+            for force in self.main_system.getForces():
+                if type(force) is OM.HarmonicBondForce:
+                    terms = [force.getBondParameters(i) for i in range(force.getNumBonds())]
+                    n = 2
+                elif type(force) is OM.HarmonicAngleForce:
+                    terms = [force.getAngleParameters(i) for i in range(force.getNumAngles())]
+                    n = 3
+                elif type(force) is OM.PeriodicTorsionForce:
+                    terms = [force.getTorsionParameters(i) for i in range(force.getNumTorsions())]
+                    n = 4
+                elif type(force) is OM.NonbondedForce:
+                    terms = [force.getExceptionParameters(i) for i in range(force.getNumExceptions())]
+                    n = 2
+                elif type(force) is OM.CMMotionRemover:
+                    terms = []
+                    n = 0
+                else:
+                    raise ValueError('{} cannot be extracted for a subsystem'.format(type(force).__name__))
+
+                self.main_system_terms.append({'force' : force, 'terms' : terms, 'n' : n,
+                                               'atom_terms' : OpenMMWrapper.index_terms(terms, n)})
+
+            constraints = [self.main_system.getConstraintParameters(i) for i in range(self.main_system.getNumConstraints())]
+            self.main_system_constraints = {'terms' : constraints, 'n' : 2,
+                                            'atom_terms' : OpenMMWrapper.index_terms(constraints, 2)}
+
+        return self.main_system
+
+    def index_terms(terms, n):
+        """
+        Finds the terms each atom is involved in
+
+        Parameters
+        ----------
+        terms : list
+            parameters of each term, with the first n 
+            entries being the indices of the atoms involved
+        n : int
+            the number of atoms in each term
+
+        Returns
+        -------
+        dict
+            atom index : list of the indices of terms containing the atom
+        """
+
+        atom_terms = {}
+        for t, term in enumerate(terms):
+            for a in term[:n]:
+                atom_terms.setdefault(a, []).append(t)
+
+        return atom_terms
+
+    def create_openmm_subsystem(self, topology, atoms, include_coulomb='all', link_atoms=None):
+        """
+        Creates an OpenMM System object for a subsystem by extracting
+        the bonded and nonbonded terms of its atoms from the OpenMM system 
+        of the entire system, 
+        see :func:`~janus.mm_wrapper.OpenMMWrapper.get_main_system`.
+        This avoids matching the subsystem to forcefield templates.
+
+        A term is included if all of its atoms are in the subsystem.
+        Link atoms are given the parameters of their residue template 
+        by the forcefield, which are not in the OpenMM system of the 
+        entire system, so subsystems with link atoms are created with 
+        :func:`~janus.mm_wrapper.OpenMMWrapper.create_openmm_system`.
+
+        Parameters
+        ----------
+        topology : OpenMM topology object
+        atoms : list
+            indices in the entire system of the atoms in topology, 
+            with link atoms given the index of the MM atom they replace
+        include_coulomb : str
+            whether to include coulombic interactions. 
+            'all' (default) includes coulombic forces for all particles,
+            'no_link' excludes coulombic forces for link atoms,
+            'only' excludes all other forces for all atoms,
+            'none' excludes coulombic forces for all particles.
+        link_atoms : list
+            indices of the link atoms in topology. Default is None.
+
+        Returns
+        -------
+        OpenMM system object
+
+        Examples
+        --------
+        >>> openmm_sys = create_openmm_subsystem(top, [0,1,2])
+        openmm_sys = create_openmm_subsystem(top, [0,1,2,4], include_coulomb='no_link', link_atoms=[3])
+        """
+
+        if link_atoms:
+            return self.create_openmm_system(topology, include_coulomb, link_atoms)
+
+        main_system = self.get_main_system()
+
+        # index in the subsystem of each atom from the entire system
+        index = {a : i for i, a in enumerate(atoms)}
+
+        def get_terms(terms):
+            # goes through the terms of the atoms in the subsystem, in their original order
+            term_ids = set()
+            for a in index:
+                term_ids.update(terms['atom_terms'].get(a, []))
+            for t in sorted(term_ids):
+                term = terms['terms'][t]
+                if all(a in index for a in term[:terms['n']]):
+                    yield [index[a] for a in term[:terms['n']]], term[terms['n']:]
+
+        openmm_system = OM.System()
+        openmm_system.setDefaultPeriodicBoxVectors(*main_system.getDefaultPeriodicBoxVectors())
+
+        for a in atoms:
+            openmm_system.addParticle(main_system.getParticleMass(a))
+
+        for mapped, param in get_terms(self.main_system_constraints):
+            openmm_system.addConstraint(*mapped, *param)
+
+        for terms in self.main_system_terms:
+            main_force = terms['force']
+
+            if type(main_force) is OM.HarmonicBondForce:
+                force = OM.HarmonicBondForce()
+                for mapped, param in get_terms(terms):
+                    force.addBond(*mapped, *param)
+
+            elif type(main_force) is OM.HarmonicAngleForce:
+                force = OM.HarmonicAngleForce()
+                for mapped, param in get_terms(terms):
+                    force.addAngle(*mapped, *param)
+
+            elif type(main_force) is OM.PeriodicTorsionForce:
+                force = OM.PeriodicTorsionForce()
+                for mapped, param in get_terms(terms):
+                    force.addTorsion(*mapped, *param)
+
+            elif type(main_force) is OM.NonbondedForce:
+                force = OM.NonbondedForce()
+                force.setNonbondedMethod(main_force.getNonbondedMethod())
+                force.setCutoffDistance(main_force.getCutoffDistance())
+                force.setUseSwitchingFunction(main_force.getUseSwitchingFunction())
+                force.setSwitchingDistance(main_force.getSwitchingDistance())
+                force.setUseDispersionCorrection(main_force.getUseDispersionCorrection())
+                force.setReactionFieldDielectric(main_force.getReactionFieldDielectric())
+                force.setEwaldErrorTolerance(main_force.getEwaldErrorTolerance())
+
+                for a in atoms:
+                    force.addParticle(*main_force.getParticleParameters(a))
+
+                for mapped, param in get_terms(terms):
+                    force.addException(*mapped, *param)
+
+            elif type(main_force) is OM.CMMotionRemover:
+                force = OM.CMMotionRemover(main_force.getFrequency())
+
+            force.setForceGroup(main_force.getForceGroup())
+            openmm_system.addForce(force)
+
+        self.set_coulomb(openmm_system, include_coulomb, link_atoms)
 
         return openmm_system
 
@@ -545,10 +1111,75 @@ class OpenMMWrapper(MMWrapper):
                     force.setParticleParameters(i, charge=a[0], sigma=0.0, epsilon=0.0)
         
 
+    def get_residue_signature(self, residue):
+        """
+        Gets a signature of a residue made of its name, atom names, 
+        and bonds, as well as its external bonds if these are not ignored
+        when matching residues to templates
+
+        Parameters
+        ----------
+        residue : OpenMM residue object
+
+        Returns
+        -------
+        tuple
+            the signature of the residue
+        """
+
+        atoms = tuple(sorted(atom.name for atom in residue.atoms()))
+        bonds = tuple(sorted(tuple(sorted((a1.name, a2.name))) for a1, a2 in residue.internal_bonds()))
+
+        external = ()
+        if self.ignoreExternalBonds is False:
+            external = tuple(sorted(a1.name if a1.residue is residue else a2.name for a1, a2 in residue.external_bonds()))
+
+        return (residue.name, atoms, bonds, external)
+
+    def get_residue_templates(self, topology):
+        """
+        Gets the residue templates to use for each residue of a topology. 
+        Residues are identified by their signature, 
+        see :func:`~janus.mm_wrapper.OpenMMWrapper.get_residue_signature`.
+        Templates are only matched or generated for signatures that have not been seen, 
+        and residues with a generated template are given it directly, 
+        so each distinct truncated residue is only matched once.
+
+        Parameters
+        ----------
+        topology : OpenMM topology object
+
+        Returns
+        -------
+        dict
+            residue : template name, to be used as residueTemplates in createSystem
+        """
+
+        signatures = {res : self.get_residue_signature(res) for res in topology.residues()}
+
+        if not all(sig in self.residue_signatures for sig in signatures.values()):
+            unmatched = self.forcefield.getUnmatchedResidues(topology)
+            if unmatched:
+                self.create_new_residue_template(topology)
+
+            for sig in signatures.values():
+                self.residue_signatures.setdefault(sig, None)
+
+        residue_templates = dict(self.residueTemplates)
+        for res, sig in signatures.items():
+            if (self.residue_signatures[sig] is not None and res not in residue_templates):
+                residue_templates[res] = self.residue_signatures[sig]
+
+        return residue_templates
+
     def create_new_residue_template(self, topology):
         """
         Create a new OpeMM residue template when there is no matching residue 
         and registers it into self.forcefield forcefield object.
+        Each template is saved by the signature of its residue, 
+        see :func:`~janus.mm_wrapper.OpenMMWrapper.get_residue_signature`, 
+        and is only created once. If self.residue_template_file is given, 
+        the templates are also written to this file.
     
         Note
         ----
@@ -569,10 +1200,21 @@ class OpenMMWrapper(MMWrapper):
         # Loop through list of unmatched residues
         print('Loop through list of unmatched residues')
         for i, res in enumerate(unmatched_res):
+            signature = self.get_residue_signature(res)
+            if self.residue_signatures.get(signature) is not None:
+                # a template has already been made for this residue
+                continue
+
             res_name = res.name                             # get the name of the original unmodifed residue
             n_res_name = 'N' + res.name                     # get the name of the N-terminus form of original residue
             c_res_name = 'C' + res.name                     # get the name of the C-terminus form of original residue
             name = 'Modified_' + res_name                   # assign new name
+
+            # give templates of different residues with the same name unique names
+            n = 1
+            while name in self.forcefield._templates:
+                name = 'Modified_{}_{}'.format(res_name, n)
+                n += 1
             template[i].name = name
 
             # loop through all atoms in modified template and all atoms in orignal template to assign atom type
@@ -593,20 +1235,59 @@ class OpenMMWrapper(MMWrapper):
                         if atom.name == atom4.name:
                             atom.type = atom4.type
 
-            # override existing modified residues with same name
-            if name in self.forcefield._templates:
-                print('override existing modified residues with name {}'.format(name))
-                template[i].overrideLevel = self.forcefield._templates[name].overrideLevel + 1
-
             # register the new template to the forcefield object
             print('register the new template to the forcefield object')
             self.forcefield.registerResidueTemplate(template[i])
+            self.residue_signatures[signature] = name
+            self.generated_templates.append(template[i])
 
+        if self.residue_template_file is not None:
+            self.save_residue_templates()
 
-    def create_openmm_simulation(self, openmm_system, topology, positions, integrator,  return_integrator=False, seed=0):
+    def save_residue_templates(self):
+        """
+        Writes the residue templates generated by 
+        :func:`~janus.mm_wrapper.OpenMMWrapper.create_new_residue_template`
+        to self.residue_template_file as a forcefield xml file
+        """
+
+        forcefield = ET.Element('ForceField')
+        residues = ET.SubElement(forcefield, 'Residues')
+
+        for template in self.generated_templates:
+            residue = ET.SubElement(residues, 'Residue', name=template.name)
+            for atom in template.atoms:
+                attributes = {'name' : atom.name, 'type' : atom.type}
+                attributes.update({k : str(v) for k, v in atom.parameters.items()})
+                ET.SubElement(residue, 'Atom', **attributes)
+            for a1, a2 in template.bonds:
+                ET.SubElement(residue, 'Bond', atomName1=template.atoms[a1].name, atomName2=template.atoms[a2].name)
+            for a in template.externalBonds:
+                ET.SubElement(residue, 'ExternalBond', atomName=template.atoms[a].name)
+
+        ET.ElementTree(forcefield).write(self.residue_template_file)
+
+    def load_residue_templates(self):
+        """
+        Loads the residue templates saved in self.residue_template_file 
+        into self.forcefield, if the file exists
+        """
+
+        if (self.residue_template_file is not None and os.path.isfile(self.residue_template_file)):
+            print('loading residue templates from {}'.format(self.residue_template_file))
+            self.forcefield.loadFile(self.residue_template_file)
+
+            for residue in ET.parse(self.residue_template_file).getroot().iter('Residue'):
+                self.generated_templates.append(self.forcefield._templates[residue.get('name')])
+
+
+    def create_openmm_simulation(self, openmm_system, topology, positions, integrator,  return_integrator=False, seed=0, main=False):
         """
         Creates an OpenMM simulation object given
-        an OpenMM system, topology, and positions
+        an OpenMM system, topology, and positions.
+        If self.platform is given, the simulation uses this platform 
+        with self.platform_properties for the system of interest 
+        and self.subsystem_platform_properties otherwise.
 
         Parameters
         ----------
@@ -621,6 +1302,8 @@ class OpenMMWrapper(MMWrapper):
         seed : int
             Set a random seed number for the Langevin integrator. 
             Default is 0, which means seed is randomized every time.
+        main : bool
+            Whether the simulation is of the system of interest. Default is False.
 
         Returns
         -------
@@ -644,7 +1327,18 @@ class OpenMMWrapper(MMWrapper):
         else:
             print('only Langevin integrator supported currently')
 
-        simulation = OM_app.Simulation(topology, openmm_system, integrator_obj)
+        if self.platform is not None:
+            if (main is True or self.subsystem_platform_properties is None):
+                properties = self.platform_properties
+            else:
+                properties = self.subsystem_platform_properties
+
+            platform = OM.Platform.getPlatformByName(self.platform)
+            properties = {k : str(v) for k, v in properties.items()}
+            simulation = OM_app.Simulation(topology, openmm_system, integrator_obj, platform, properties)
+        else:
+            simulation = OM_app.Simulation(topology, openmm_system, integrator_obj)
+
         simulation.context.setPositions(positions)
 
         if integrator == 'Verlet':
@@ -893,6 +1587,7 @@ class OpenMMWrapper(MMWrapper):
                 self.pdb = OM_app.PDBFile(self.system_info)
             # instantiate OpenMM forcefield object
             self.forcefield = OM_app.ForceField(self.ff, self.ff_water)
+            self.load_residue_templates()
             self.topology = self.pdb.topology
             self.positions = self.pdb.positions
             self.PeriodicBoxVector = self.topology.getPeriodicBoxVectors()
@@ -906,6 +1601,7 @@ class OpenMMWrapper(MMWrapper):
                 if fil.endswith('pdb'):
                     self.pdb = OM_app.PDBFile(fil)
                     self.forcefield = OM_app.ForceField(self.ff, self.ff_water)
+                    self.load_residue_templates()
                     self.topology = self.pdb.topology
                     self.use_pdb = True
                 if fil.endswith('inpcrd'):
@@ -1,2 +1,9 @@
 from janus.qm_wrapper.qm_wrapper import QMWrapper
-from janus.qm_wrapper.psi4_wrapper import Psi4Wrapper
+from janus.qm_wrapper.analytic_wrapper import AnalyticWrapper
+from janus.qm_wrapper.qm_executor import QMExecutor
+
+# psi4 is only needed for Psi4Wrapper
+try:
+    from janus.qm_wrapper.psi4_wrapper import Psi4Wrapper
+except ImportError:
+    Psi4Wrapper = None
@@ -0,0 +1,228 @@
+import numpy as np
+import mdtraj as md
+from scipy.optimize import minimize
+from janus.qm_wrapper import QMWrapper
+
+class AnalyticWrapper(QMWrapper):
+    """
+    A wrapper class with a cheap, deterministic analytic potential
+    with exact gradients in place of a quantum mechanical computation,
+    for testing and for benchmarking janus without a QM program.
+    Class inherits from QMWrapper.
+
+    The energy in hartrees is a sum of atomic energies, Morse pair potentials
+    between all atoms, and the coulomb interactions of fixed partial charges
+    on the atoms with the external charges
+
+    .. math::
+        E = \\sum_i e_i + \\sum_{i<j} D [(1 - e^{-a(r_{ij} - r^0_{ij})})^2 - 1]
+          + \\sum_i \\sum_k \\frac{q_i Q_k}{\\sqrt{|r_i - R_k|^2 + w^2}}
+
+    where the atomic energies are :math:`e_i = -0.5 Z_i^{7/3}`,
+    the equilibrium distances :math:`r^0_{ij}` are the sums of covalent radii,
+    and the coulomb interactions are damped by the width w so the energy is bounded.
+    """
+
+    # covalent radii in angstroms by atomic number
+    covalent_radii = {1 : 0.31, 6 : 0.76, 7 : 0.71, 8 : 0.66, 9 : 0.57, 15 : 1.07, 16 : 1.05, 17 : 1.02}
+    default_radius = 0.75
+    # partial charges by atomic number, giving neutral water
+    default_partial_charges = {1 : 0.4, 6 : 0.0, 7 : -0.4, 8 : -0.8}
+
+    ang_to_bohr = 1.8897161646321
+
+    def __init__(self,
+                 charge=0,
+                 multiplicity=1,
+                 well_depth=0.1,
+                 stiffness=1.0,
+                 partial_charges=None,
+                 charge_width=1.0,
+                 sys_info=None,
+                 sys_info_format=None,
+                 **kwargs):
+        """
+        Initializes an AnalyticWrapper class with the parameters of the potential
+
+        Parameters
+        ----------
+        param : dict
+            parameters of the potential
+            Individual parameters include:
+
+            - charge : charge of qm system, default is 0
+            - multiplicity : spin state of qm system, default is singlet(1)
+            - well_depth : depth D of the Morse potentials in hartrees, default is 0.1
+            - stiffness : width parameter a of the Morse potentials in 1/bohr, default is 1.0
+            - partial_charges : dict of the partial charge of each atomic number,
+                                for the interaction with external charges.
+                                Default is None, which uses default_partial_charges
+            - charge_width : width w in bohr damping the coulomb interactions, default is 1.0
+
+            Other parameters, e.g. those meant for Psi4, are saved
+            but do not change the potential
+        """
+
+        super().__init__("Analytic")
+        self.energy = None
+        self.gradient = None
+        self.wavefunction = None
+
+        self.charge = charge
+        self.multiplicity = multiplicity
+        self.well_depth = well_depth
+        self.stiffness = stiffness
+        self.partial_charges = partial_charges
+        self.charge_width = charge_width
+
+        self.qm_param = kwargs
+
+    def compute_energy_and_gradient(self, xyz):
+        """
+        Computes the energy and gradient of the potential
+
+        Parameters
+        ----------
+        xyz : numpy array
+            coordinates of the atoms in angstroms
+
+        Returns
+        -------
+        float
+            energy in hartrees
+        numpy array
+            gradient in hartree/bohr
+        """
+
+        Z = np.asarray(self.qm_atomic_numbers, dtype=int)
+        r = np.asarray(xyz, dtype=np.float64).reshape(-1, 3) * AnalyticWrapper.ang_to_bohr
+
+        energy = np.sum(-0.5 * Z**(7/3))
+        gradient = np.zeros_like(r)
+
+        # Morse pair potentials
+        radii = np.array([AnalyticWrapper.covalent_radii.get(z, AnalyticWrapper.default_radius) for z in Z])
+        r0 = (radii[:, None] + radii[None, :]) * AnalyticWrapper.ang_to_bohr
+        i, j = np.triu_indices(len(Z), k=1)
+        rij = r[i] - r[j]
+        dist = np.linalg.norm(rij, axis=1)
+        x = np.exp(-self.stiffness * (dist - r0[i, j]))
+
+        energy += np.sum(self.well_depth * ((1 - x)**2 - 1))
+        dE_dr = 2 * self.well_depth * self.stiffness * x * (1 - x)
+        pair_gradient = (dE_dr / dist)[:, None] * rij
+        np.add.at(gradient, i, pair_gradient)
+        np.add.at(gradient, j, -pair_gradient)
+
+        # coulomb interactions with the external charges
+        if self.external_charges is not None:
+            charges = np.asarray(self.external_charges, dtype=np.float64).reshape(-1, 4)
+            partial_charges = self.partial_charges if self.partial_charges is not None else AnalyticWrapper.default_partial_charges
+            q = np.array([partial_charges.get(z, 0.0) for z in Z])
+            rik = r[:, None, :] - charges[None, :, 1:] * AnalyticWrapper.ang_to_bohr
+            dist = np.sqrt(np.sum(rik**2, axis=2) + self.charge_width**2)
+            qQ = q[:, None] * charges[None, :, 0]
+
+            energy += np.sum(qQ / dist)
+            gradient -= np.sum((qQ / dist**3)[:, :, None] * rik, axis=1)
+
+        return float(energy), gradient
+
+    def compute_info(self):
+        """
+        Computes the energy and gradient of the QM region
+        and saves them as self.energy and self.gradient
+        """
+
+        if self.qm_xyz is None:
+            self.set_geom_arrays_from_string()
+
+        self.energy, self.gradient = self.compute_energy_and_gradient(self.qm_xyz)
+
+    def optimize_geometry(self):
+        """
+        Minimizes the energy with respect to the coordinates of the QM region
+
+        Returns
+        -------
+        numpy array
+            XYZ coordinates of the optimized geometry in bohr
+        """
+
+        if self.qm_xyz is None:
+            self.set_geom_arrays_from_string()
+
+        def fun(x):
+            energy, gradient = self.compute_energy_and_gradient(x)
+            # gradient with respect to coordinates in angstroms
+            return energy, gradient.flatten() * AnalyticWrapper.ang_to_bohr
+
+        result = minimize(fun, self.qm_xyz.flatten(), jac=True, method='L-BFGS-B')
+
+        xyz = result.x.reshape(-1, 3)
+        self.energy, self.gradient = self.compute_energy_and_gradient(xyz)
+
+        return xyz * AnalyticWrapper.ang_to_bohr
+
+    def set_geom_arrays_from_string(self):
+        """
+        Sets the coordinate and atomic number arrays from self.qm_geometry,
+        for geometries given as a string of XYZ coordinates in angstroms
+        """
+
+        symbols, xyz = [], []
+        for line in self.qm_geometry.strip().split('\n'):
+            if line.strip():
+                fields = line.split()
+                symbols.append(fields[0])
+                xyz.append([float(f) for f in fields[1:4]])
+
+        atomic_numbers = [AnalyticWrapper.get_atomic_number(symbol) for symbol in symbols]
+        geometry = self.qm_geometry
+        self.set_qm_arrays(xyz, atomic_numbers, symbols)
+        self.qm_geometry = geometry
+
+    def get_atomic_number(symbol):
+        """
+        Gets the atomic number of an element symbol
+
+        Parameters
+        ----------
+        symbol : str
+            element symbol
+
+        Returns
+        -------
+        int
+            atomic number
+        """
+
+        return md.element.get_by_symbol(symbol).atomic_number
+
+    def build_qm_param(self):
+        """
+        Builds a dictionary of QM parameters from input options
+        and saves as self.qm_param
+        """
+        return self.qm_param
+
+    def get_wrapper_param(self):
+        """
+        Gets the parameters needed to create a copy of this wrapper,
+        e.g. in a worker process of :class:`~janus.qm_wrapper.QMExecutor`
+
+        Returns
+        -------
+        dict
+            keyword arguments of AnalyticWrapper
+        """
+
+        param = dict(self.qm_param)
+        param['charge'] = self.charge
+        param['multiplicity'] = self.multiplicity
+        param['well_depth'] = self.well_depth
+        param['stiffness'] = self.stiffness
+        param['partial_charges'] = self.partial_charges
+        param['charge_width'] = self.charge_width
+
+        return param
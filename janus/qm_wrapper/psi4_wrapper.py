@@ -1,5 +1,11 @@
 import psi4
 import numpy as np
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict, deque
+from scipy.special import comb
 from janus.qm_wrapper import QMWrapper
 
 class Psi4Wrapper(QMWrapper):
@@ -8,6 +14,10 @@ class Psi4Wrapper(QMWrapper):
     information. Class inherits from QMWrapper.
     """
 
+    # options currently set in the psi4 module by a persistent session,
+    # shared by all instances since psi4 options are global
+    session_options = None
+
     def __init__(self,
                  method='scf',
                  charge=0,
@@ -18,6 +28,17 @@ class Psi4Wrapper(QMWrapper):
                  d_convergence=1e-8,
                  sys_info=None,
                  sys_info_format=None,
+                 charge_method=None,
+                 reuse_guess=False,
+                 extrapolation_order=2,
+                 guess_history_size=20,
+                 persistent_session=False,
+                 geometry_string=False,
+                 cache_dir=None,
+                 cache_size=1024,
+                 cache_tolerance=1e-5,
+                 num_threads=None,
+                 memory=None,
                  **kwargs):
         """
         Initializes a Psi4Wrapper class with a set of 
@@ -38,9 +59,44 @@ class Psi4Wrapper(QMWrapper):
             - e_convergence : degree of energy convergence, default is 1e-8
             - d_convergence : degree of density convergence, default is 1e-8
             - method : computation method, default is scf
-            - charge_method : method for getting QM charges, default is Mulliken
+            - charge_method : method for getting QM charges, e.g. MULLIKEN_CHARGES. 
+                              If given, the charges are computed from the same Psi4 run 
+                              as the energy and gradient. Default is None
             - charge : charge of qm system, default is 0
             - multiplicity : spin state of qm system, default is singlet(1)
+            - reuse_guess : whether to start the SCF of a QM region from the 
+                            wavefunctions of previous computations on the same atoms, 
+                            see :func:`~janus.qm_wrapper.Psi4Wrapper.write_guess`. 
+                            Default is False
+            - extrapolation_order : order k of the always stable predictor-corrector (ASPC) 
+                                    extrapolation of the densities of the last k+2 steps used 
+                                    for the guess. 0 uses the wavefunction of the last step 
+                                    without extrapolation. Default is 2
+            - guess_history_size : the maximum number of QM regions for which 
+                                   previous wavefunctions are kept. Default is 20
+            - persistent_session : whether to keep the psi4 options between computations, 
+                                   so that only the options that changed are set and 
+                                   only the geometry and external charges are replaced, 
+                                   see :func:`~janus.qm_wrapper.Psi4Wrapper.set_up_psi4`. 
+                                   Default is False
+            - geometry_string : whether to build the psi4 molecule from a formatted 
+                                string of the geometry instead of the coordinate and 
+                                atomic number arrays. Coordinates are rounded to 0.001 
+                                angstroms, so this is only meant for debugging. Default is False
+            - cache_dir : directory of an on-disk cache of energies, gradients and charges, 
+                          so computations with the same input are only run once, 
+                          see :func:`~janus.qm_wrapper.QMWrapper.get_cache_key`. 
+                          Default is None, which does not use a cache
+            - cache_size : maximum size of the cache in MB, beyond which the least 
+                           recently used results are removed. Default is 1024
+            - cache_tolerance : tolerance in angstroms to which coordinates are rounded 
+                                for the cache. Default is 1e-5
+            - num_threads : number of threads psi4 uses. Default is None, 
+                            which uses the psi4 default or the allocation of 
+                            :func:`~janus.qmmm.QMMM.allocate_qm_resources`
+            - memory : memory psi4 uses in bytes. Default is None, 
+                       which uses the psi4 default or the allocation of 
+                       :func:`~janus.qmmm.QMMM.allocate_qm_resources`
 
             For more information about these parameters and 
             other possible parameter values consult psicode.org
@@ -53,6 +109,27 @@ class Psi4Wrapper(QMWrapper):
         self.gradient = None
 
         self.method = method
+        self.charge_method = charge_method
+
+        # densities of previous steps, keyed by the atoms of the QM region
+        self.reuse_guess = reuse_guess
+        self.extrapolation_order = extrapolation_order
+        self.guess_history_size = guess_history_size
+        self.guess_history = OrderedDict()
+        self.guess_dir = None
+
+        # keyword arguments for psi4 with the external charges
+        self.extern_kwargs = {}
+
+        self.persistent_session = persistent_session
+        self.geometry_string = geometry_string
+
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.cache_tolerance = cache_tolerance
+
+        self.num_threads = num_threads
+        self.memory = memory
         self.charge = charge
         self.multiplicity = multiplicity
 
@@ -69,7 +146,7 @@ class Psi4Wrapper(QMWrapper):
         """
         self.set_up_psi4()
         self.energy, self.wavefunction = psi4.energy(self.method,
-                                                       return_wfn=True)
+                                                       return_wfn=True, **self.extern_kwargs)
 
     def compute_gradient(self):
         """
@@ -77,33 +154,160 @@ class Psi4Wrapper(QMWrapper):
         and saves it as a numpy array self.gradient
         """
         self.set_up_psi4()
-        G = psi4.gradient(self.method)
+        G, self.wavefunction = psi4.gradient(self.method, return_wfn=True, **self.extern_kwargs)
+        self.energy = self.wavefunction.energy()
         self.gradient = np.asarray(G)
 
-    def compute_info(self):
+    def compute_info(self, charge_method=None):
         """
         Calls Psi4 to obtain the energy, Psi4 wavefunction object, and 
         gradient of the QM region and saves as self.energy, self.wavefuction,
-        and self.gradient
+        and self.gradient. All are obtained from a single gradient computation,
+        so the SCF is only converged once. If a charge method is given, 
+        the charges on each atom are computed from the same wavefunction 
+        and saved as self.charges.
+
+        Parameters
+        ----------
+        charge_method : str
+            method for getting QM charges, e.g. MULLIKEN_CHARGES. 
+            Default is None, which uses self.charge_method
+
+        Returns
+        -------
+        dict
+            A dictionary with the energy('energy'), gradient('gradients'), 
+            Psi4 wavefunction object('wavefunction'), and charges('charges'), 
+            which is None if no charges are computed
         """
+
+        if charge_method is None:
+            charge_method = self.charge_method
+
         try:
             self.set_up_psi4()
-            self.energy, self.wavefunction = psi4.energy(self.method,
-                                                        return_wfn=True)
-
-            G = psi4.gradient(self.method)
-            self.gradient = np.asarray(G)
-        except:
+            G, self.wavefunction = psi4.gradient(self.method, return_wfn=True, **self.extern_kwargs, **self.write_guess())
+        except Exception:
+            # run again with psi4 output shown
             self.set_up_psi4(be_quiet=False)
-            self.energy, self.wavefunction = psi4.energy(self.method,
-                                                        return_wfn=True)
+            G, self.wavefunction = psi4.gradient(self.method, return_wfn=True, **self.extern_kwargs)
 
-            G = psi4.gradient(self.method)
-            self.gradient = np.asarray(G)
-            
-        #deriv = psi4.core.Deriv(self.wavefunction)
-        #deriv.compute()
-        #self.gradient = np.asarray(self.wavefunction.gradient())
+        self.energy = self.wavefunction.energy()
+        self.gradient = np.asarray(G)
+        self.save_guess()
+
+        self.charges = None
+        if charge_method is not None:
+            self.compute_scf_charges(charge_method)
+
+        result = {}
+        result['energy'] = self.energy
+        result['gradients'] = self.gradient
+        result['wavefunction'] = self.wavefunction
+        result['charges'] = self.charges
+
+        return result
+
+    def get_aspc_coefficients(k):
+        """
+        Gets the coefficients of the always stable predictor-corrector (ASPC) 
+        extrapolation of Kolafa, J. Comput. Chem. 25, 335 (2004)
+
+        .. math::
+            B_j = (-1)^{j+1} j \\frac{\\binom{2k+4}{k+2-j}}{\\binom{2k+2}{k+1}}, \\quad j = 1, ..., k+2
+
+        Parameters
+        ----------
+        k : int
+            order of the extrapolation, which uses k+2 previous steps
+
+        Returns
+        -------
+        numpy array
+            coefficients of the previous steps, starting from the most recent 
+
+        Examples
+        --------
+        >>> get_aspc_coefficients(1)
+        """
+
+        j = np.arange(1, k + 3)
+        return (-1)**(j + 1) * j * comb(2*k + 4, k + 2 - j) / comb(2*k + 2, k + 1)
+
+    def save_guess(self):
+        """
+        Saves the density of the current wavefunction to the history 
+        of the current QM region, identified by self.atoms, 
+        if self.reuse_guess is True
+        """
+
+        if (self.reuse_guess is False or self.atoms is None):
+            return
+
+        if self.atoms not in self.guess_history:
+            self.guess_history[self.atoms] = {'densities' : deque(maxlen=self.extrapolation_order + 2)}
+            # remove the least recently used QM regions
+            while len(self.guess_history) > self.guess_history_size:
+                self.guess_history.popitem(last=False)
+
+        history = self.guess_history[self.atoms]
+        history['wavefunction'] = self.wavefunction
+        history['densities'].appendleft((np.array(self.wavefunction.Da()), np.array(self.wavefunction.Db())))
+
+    def write_guess(self):
+        """
+        Writes a guess for the SCF of the current QM region to a file, if there 
+        are previous wavefunctions of the same atoms and self.reuse_guess is True.
+        If densities of enough previous steps are saved, the guess orbitals are 
+        the natural orbitals of the ASPC extrapolation of these densities, 
+        see :func:`~janus.qm_wrapper.Psi4Wrapper.get_aspc_coefficients`. 
+        Otherwise, or if self.extrapolation_order is 0, the orbitals of the last step are used. 
+        If the QM region has changed, Psi4 uses its default guess.
+        The guess file is written in the scratch directory given to 
+        :func:`~janus.qm_wrapper.Psi4Wrapper.set_scratch_dir`, or in a temporary 
+        directory that is removed with the wrapper.
+
+        Returns
+        -------
+        dict
+            keyword arguments for Psi4, with the guess file as 'restart_file', 
+            empty if there is no guess
+        """
+
+        if (self.reuse_guess is False or self.atoms not in self.guess_history):
+            return {}
+
+        self.guess_history.move_to_end(self.atoms)
+        history = self.guess_history[self.atoms]
+        wfn = history['wavefunction']
+        guess = wfn.c1_deep_copy(wfn.basisset())
+
+        k = min(self.extrapolation_order, len(history['densities']) - 2)
+        if (self.extrapolation_order > 0 and k >= 0):
+            B = Psi4Wrapper.get_aspc_coefficients(k)
+
+            # overlap matrix at the current geometry
+            basis = psi4.core.BasisSet.build(self.molecule, 'ORBITAL', self.qm_param['basis'])
+            S = np.asarray(psi4.core.MintsHelper(basis).ao_overlap())
+            s, U = np.linalg.eigh(S)
+            S_half = U.dot(np.diag(np.sqrt(s))).dot(U.T)
+            S_inv_half = U.dot(np.diag(1/np.sqrt(s))).dot(U.T)
+
+            for spin, C in enumerate([guess.Ca(), guess.Cb()]):
+                D = sum(b * d[spin] for b, d in zip(B, history['densities']))
+                # natural orbitals in order of decreasing occupation
+                occ, V = np.linalg.eigh(S_half.dot(D).dot(S_half))
+                C.np[:] = S_inv_half.dot(V[:, ::-1])[:, :C.np.shape[1]]
+
+        if self.guess_dir is None:
+            self.guess_dir = tempfile.mkdtemp(prefix='janus_guess_')
+            # removed when the wrapper is garbage collected or at exit
+            weakref.finalize(self, shutil.rmtree, self.guess_dir, ignore_errors=True)
+
+        guess_file = os.path.join(self.guess_dir, 'guess.npy')
+        guess.to_file(guess_file)
+
+        return {'restart_file' : guess_file}
 
     def optimize_geometry(self):
         """
@@ -116,38 +320,106 @@ class Psi4Wrapper(QMWrapper):
         """
 
         self.set_up_psi4()
-        self.energy, self.wavefunction = psi4.opt(self.method, return_wfn=True)
+        self.energy, self.wavefunction = psi4.opt(self.method, return_wfn=True, **self.extern_kwargs)
         return np.array(self.wavefunction.molecule().geometry())
 
     def set_up_psi4(self, be_quiet=True):
         """
-        Sets up a psi4 computation
+        Sets up a psi4 computation. 
+
+        If self.persistent_session is True, the psi4 options are only cleaned 
+        and set on the first call. Later calls only set the options that 
+        differ from those of the last call, and replace the geometry 
+        and external charges. The options are cleaned again if an option 
+        was removed or psi4 output is shown.
+
+        Parameters
+        ----------
+        be_quiet : bool
+            whether to suppress psi4 output, default is True
         """
         # psi4.core.set_output_file('output.dat', True)
         psi4.core.clean()
-        psi4.core.clean_options()
-        psi4.core.EXTERN = None 
+
+        if (self.persistent_session is True and be_quiet is True 
+                and Psi4Wrapper.session_options is not None
+                and set(Psi4Wrapper.session_options).issubset(self.qm_param)):
+
+            changed = {key : value for key, value in self.qm_param.items() 
+                       if key not in Psi4Wrapper.session_options or Psi4Wrapper.session_options[key] != value}
+            if changed:
+                psi4.set_options(changed)
+
+        else:
+            psi4.core.clean_options()
+            psi4.core.EXTERN = None 
         
-        # Supress print out
-        if be_quiet is True:
-            psi4.core.be_quiet()
+            # Supress print out
+            if be_quiet is True:
+                psi4.core.be_quiet()
         
-        psi4.set_options(self.qm_param)
+            psi4.set_options(self.qm_param)
+
+        if self.num_threads is not None:
+            psi4.set_num_threads(int(self.num_threads))
+        if self.memory is not None:
+            psi4.set_memory(int(self.memory), quiet=True)
+
+        if (self.persistent_session is True and be_quiet is True):
+            Psi4Wrapper.session_options = dict(self.qm_param)
+        else:
+            Psi4Wrapper.session_options = None
+
+        if (self.qm_geometry is None and self.geometry_string is False):
+            # build the molecule from the coordinates in angstroms
+            mol = psi4.core.Molecule.from_arrays(geom=self.qm_xyz,
+                                                 elez=self.qm_atomic_numbers,
+                                                 units='Angstrom',
+                                                 molecular_charge=self.charge,
+                                                 molecular_multiplicity=self.multiplicity,
+                                                 fix_com=True,
+                                                 fix_orientation=True,
+                                                 # the guess orbitals are written without symmetry
+                                                 fix_symmetry='c1' if self.reuse_guess is True else None)
+            psi4.activate(mol)
 
-        psi4_geom = '\n' + str(self.charge) + ' ' + str(self.multiplicity) + '\n '
-        psi4_geom += self.qm_geometry
-        psi4_geom += 'no_reorient \n'
-        psi4_geom += 'no_com \n '
-        #print(psi4_geom)
+        else:
+            psi4_geom = '\n' + str(self.charge) + ' ' + str(self.multiplicity) + '\n '
+            psi4_geom += self.get_geom_string()
+            psi4_geom += 'no_reorient \n'
+            psi4_geom += 'no_com \n '
+            #print(psi4_geom)
 
-        # make sure this is in angstroms
-        mol = psi4.geometry(psi4_geom)
+            # the guess orbitals are written without symmetry
+            if self.reuse_guess is True:
+                psi4_geom += 'symmetry c1 \n '
 
+            # make sure this is in angstroms
+            mol = psi4.geometry(psi4_geom)
+
+        self.molecule = mol
+
+        self.extern_kwargs = {}
         if self.external_charges is not None:
-            Chrgfield = psi4.QMMM()
-            for charge in self.external_charges:
-                Chrgfield.extern.addCharge(charge[0], charge[1], charge[2], charge[3])
-            psi4.core.set_global_option_python('EXTERN', Chrgfield.extern)
+            # rows of charge and position in angstroms
+            charges = np.asarray(self.external_charges, dtype=np.float64).reshape(-1, 4)
+
+            if hasattr(psi4.core.ExternalPotential, 'appendCharges'):
+                # newer versions of psi4 take the charges as an array with positions in bohr
+                external_potentials = charges.copy()
+                external_potentials[:, 1:] /= psi4.constants.bohr2angstroms
+                self.extern_kwargs['external_potentials'] = external_potentials
+            else:
+                Chrgfield = psi4.QMMM()
+                for q, x, y, z in charges.tolist():
+                    Chrgfield.extern.addCharge(q, x, y, z)
+                psi4.core.set_global_option_python('EXTERN', Chrgfield.extern)
+
+        elif (Psi4Wrapper.session_options is not None 
+                and not hasattr(psi4.core.ExternalPotential, 'appendCharges')):
+            # remove the external charges of the last computation 
+            psi4.core.EXTERN = None 
+            psi4.core.set_global_option_python('EXTERN', None)
 
             
     def compute_scf_charges(self, charge_method='MULLIKEN_CHARGES'):
@@ -166,17 +438,54 @@ class Psi4Wrapper(QMWrapper):
         """
         Calls Psi4 to obtain the self.energy, self.wavefunction, 
         and self.charges on each atom. This method for correlated methods.
-        
-        Note
-        ----
-        Think about passing in wavefunction instead of calling for energy and wavefunction
+        The charges are computed from the wavefunction of the gradient computation
+        in :func:`~janus.qm_wrapper.Psi4Wrapper.compute_info`, so self.gradient 
+        is obtained from the same Psi4 run.
         """
-        self.set_up_psi4()
-        self.energy, self.wavefunction = psi4.prop(self.method,
-                                properties=[charge_method],
-                                return_wfn=True)
-        self.charges = np.asarray(self.wavefunction.atomic_point_charges())
+        self.compute_info(charge_method)
+
+
+    def get_wrapper_param(self):
+        """
+        Gets the parameters needed to create a copy of this wrapper, 
+        e.g. in a worker process of :class:`~janus.qm_wrapper.QMExecutor`
+
+        Returns
+        -------
+        dict
+            keyword arguments of Psi4Wrapper
+        """
+
+        param = dict(self.qm_param)
+        param['method'] = self.method
+        param['charge'] = self.charge
+        param['multiplicity'] = self.multiplicity
+        param['charge_method'] = self.charge_method
+        param['reuse_guess'] = self.reuse_guess
+        param['extrapolation_order'] = self.extrapolation_order
+        param['guess_history_size'] = self.guess_history_size
+        param['persistent_session'] = self.persistent_session
+        param['geometry_string'] = self.geometry_string
+        param['cache_dir'] = self.cache_dir
+        param['cache_size'] = self.cache_size
+        param['cache_tolerance'] = self.cache_tolerance
+        param['num_threads'] = self.num_threads
+        param['memory'] = self.memory
+
+        return param
 
+    def set_scratch_dir(self, scratch_dir):
+        """
+        Sets the directory for psi4 scratch files
+
+        Parameters
+        ----------
+        scratch_dir : str
+            path of the scratch directory
+        """
+        psi4.core.IOManager.shared_object().set_default_path(os.path.abspath(scratch_dir))
+        # guess files are written with the other scratch files, and removed with them
+        self.guess_dir = os.path.abspath(scratch_dir)
 
     def build_qm_param(self):
         """
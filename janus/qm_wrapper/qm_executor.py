@@ -0,0 +1,202 @@
+import os
+import shutil
+import tempfile
+import weakref
+import multiprocessing as mp
+import numpy as np
+from janus.qm_wrapper.qm_wrapper import QMWrapper
+
+# state of a worker process, set by _initialize_worker
+_worker = {'scratch_dir' : None, 'wrappers' : {}}
+
+def _initialize_worker(scratch_root):
+    """
+    Creates the scratch directory of a worker process
+
+    Parameters
+    ----------
+    scratch_root : str
+        directory in which to create the scratch directory,
+        None uses the default temporary directory
+    """
+
+    _worker['scratch_dir'] = tempfile.mkdtemp(prefix='janus_qm_worker_', dir=scratch_root)
+    # for QM programs that read their scratch directory from the environment
+    os.environ['PSI_SCRATCH'] = _worker['scratch_dir']
+
+def _run_job(job):
+    """
+    Runs a QM job in a worker process. Each worker keeps one wrapper
+    for every set of wrapper parameters, so information saved by the
+    wrapper, such as previous wavefunctions, is kept between jobs
+
+    Parameters
+    ----------
+    job : dict
+        job as made by :func:`~janus.qm_wrapper.QMExecutor.make_job`
+
+    Returns
+    -------
+    dict
+        the information returned by get_energy_and_gradient of the wrapper
+    """
+
+    # resources may be allocated differently every step, 
+    # so the same wrapper is used for any resources
+    param = {key : value for key, value in job['wrapper_param'].items() if key not in QMWrapper.resource_param}
+    key = (job['wrapper_class'], repr(sorted(param.items())))
+
+    if key not in _worker['wrappers']:
+        wrapper = job['wrapper_class'](**dict(job['wrapper_param']))
+        wrapper.set_scratch_dir(_worker['scratch_dir'])
+        _worker['wrappers'][key] = wrapper
+
+    wrapper = _worker['wrappers'][key]
+    for resource in QMWrapper.resource_param:
+        if resource in job['wrapper_param']:
+            setattr(wrapper, resource, job['wrapper_param'][resource])
+    wrapper.set_qm_arrays(job['xyz'], job['atomic_numbers'], job['symbols'])
+    wrapper.external_charges = job['charges']
+
+    return dict(wrapper.get_energy_and_gradient(atoms=job['atoms']))
+
+def _stop_workers(pool, scratch_root):
+    """
+    Stops the worker processes of a pool and removes their scratch directories.
+    Called by :func:`~janus.qm_wrapper.QMExecutor.close`, or when the executor 
+    is garbage collected or the program exits without it being closed
+
+    Parameters
+    ----------
+    pool : multiprocessing.pool.Pool
+        pool of the worker processes
+    scratch_root : str
+        directory that contains the scratch directories of the workers
+    """
+
+    pool.terminate()
+    pool.join()
+    shutil.rmtree(scratch_root, ignore_errors=True)
+
+
+class QMExecutor(object):
+    """
+    Class that runs QM computations in a pool of long-lived worker processes,
+    so that computations, such as the partitions of adaptive QM/MM, can run
+    at the same time. Each worker has its own instance of the QM program
+    and its own scratch directory, so the global state of the QM program
+    is not shared between computations that run at the same time.
+
+    The workers are stopped and their scratch directories removed by 
+    :func:`~janus.qm_wrapper.QMExecutor.close`, at the end of a with block, 
+    or at the latest when the program exits.
+
+    Parameters
+    ----------
+        n_workers : int
+            number of worker processes
+        scratch_dir : str
+            directory in which the scratch directories of the workers are made.
+            Default is None, which uses the default temporary directory
+    """
+
+    def __init__(self, n_workers, scratch_dir=None):
+
+        self.n_workers = n_workers
+        self.scratch_dir = scratch_dir
+        # the scratch directories of all workers are made in here, so they can be removed together
+        self.scratch_root = tempfile.mkdtemp(prefix='janus_qm_workers_', dir=scratch_dir)
+
+        # spawn new processes so the workers do not share the state of the QM program
+        self.pool = mp.get_context('spawn').Pool(n_workers,
+                                                 initializer=_initialize_worker,
+                                                 initargs=(self.scratch_root,))
+        self._finalizer = weakref.finalize(self, _stop_workers, self.pool, self.scratch_root)
+
+    def make_job(self, wrapper, traj, charges=None, atoms=None):
+        """
+        Makes a job for the primary subsystem of a partition
+
+        Parameters
+        ----------
+        wrapper : :class:`~janus.qm_wrapper.QMWrapper` subclass
+            the wrapper whose parameters are used for the computation
+        traj : MDtraj trajectory object
+            trajectory of the primary subsystem
+        charges : numpy array
+            (N,4) array of external charges and corresponding positions in angstroms
+        atoms : list
+            indices in the entire system of the atoms in the primary subsystem
+
+        Returns
+        -------
+        dict
+            the job, with the wrapper class('wrapper_class') and parameters('wrapper_param'),
+            coordinates in angstroms('xyz'), atomic numbers('atomic_numbers'),
+            element symbols('symbols'), charges('charges') and atom indices('atoms')
+        """
+
+        job = {}
+        job['wrapper_class'] = type(wrapper)
+        job['wrapper_param'] = wrapper.get_wrapper_param()
+        job['xyz'] = np.array(traj.xyz[0], dtype=np.float64) * 10
+        job['atomic_numbers'] = [atom.element.atomic_number for atom in traj.topology.atoms]
+        job['symbols'] = [atom.element.symbol for atom in traj.topology.atoms]
+        job['charges'] = None if charges is None else np.asarray(charges, dtype=np.float64).reshape(-1, 4)
+        job['atoms'] = None if atoms is None else list(atoms)
+
+        return job
+
+    def submit(self, job):
+        """
+        Submits a job to the worker processes
+
+        Parameters
+        ----------
+        job : dict
+            job as made by :func:`~janus.qm_wrapper.QMExecutor.make_job`
+
+        Returns
+        -------
+        multiprocessing.pool.AsyncResult
+            result of the job, whose get() returns a dictionary
+            with energy('energy') and gradient('gradients') information
+        """
+
+        return self.pool.apply_async(_run_job, (job,))
+
+    def run(self, jobs):
+        """
+        Runs a list of jobs at the same time and waits for all of them
+
+        Parameters
+        ----------
+        jobs : list
+            jobs as made by :func:`~janus.qm_wrapper.QMExecutor.make_job`
+
+        Returns
+        -------
+        list
+            dictionaries with energy('energy') and gradient('gradients')
+            information, in the order of jobs
+        """
+
+        results = [self.submit(job) for job in jobs]
+        return [result.get() for result in results]
+
+    def close(self):
+        """
+        Waits for the submitted jobs, stops the worker processes 
+        and removes their scratch directories
+        """
+
+        if self._finalizer.alive:
+            self.pool.close()
+            self.pool.join()
+            self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,8 +1,15 @@
 from abc import ABC, abstractmethod
-import mendeleev as mdlv
+import numpy as np
+import os
+import tempfile
+import hashlib
 
 class QMWrapper(ABC):
 
+    # wrapper parameters that set the resources of a computation, 
+    # which do not change its results
+    resource_param = ['num_threads', 'memory']
+
     def __init__(self, class_type):
         """
         QM wrapper super class
@@ -19,9 +26,19 @@ class QMWrapper(ABC):
         self.charges = None
         self.is_open_shelled = False
         self.qm_geometry = None
+        self.qm_xyz = None
+        self.qm_atomic_numbers = None
+        self.qm_symbols = None
+        self.atoms = None
+
+        # on-disk cache of results, see get_cache_key
+        self.cache_dir = None
+        self.cache_size = 1024
+        self.cache_tolerance = 1e-5
+        self.cache_info = {'hits' : 0, 'misses' : 0, 'evictions' : 0}
 
 
-    def get_energy_and_gradient(self, traj=None, geometry=None, include_coulomb='all', link_atoms=None, minimize=False, charges=None):
+    def get_energy_and_gradient(self, traj=None, geometry=None, include_coulomb='all', link_atoms=None, minimize=False, charges=None, atoms=None):
         """
         Gets the energy and gradient from a QM computation of the primary subsystem 
 
@@ -37,8 +54,19 @@ class QMWrapper(ABC):
             indices of link_atoms
         minimize : bool
             whether to return the geometry optimized energy 
-        charges : list
-            charges and corresponding positions in angstroms as xyz coordinates
+        charges : numpy array
+            (N,4) array of charges and corresponding positions in angstroms as xyz coordinates
+        atoms : list
+            indices in the entire system of the atoms in the primary subsystem, 
+            with link atoms given the index of the MM atom they replace.
+            Used to identify computations on the same atoms, e.g. to reuse 
+            their wavefunctions. Default is None.
+
+        Note
+        ----
+        If self.cache_dir is set, results are looked up in an on-disk cache first,
+        see :func:`~janus.qm_wrapper.QMWrapper.get_cache_key`, and the wavefunction 
+        of the QM program is not updated for results taken from the cache.
 
         Returns
         -------
@@ -58,17 +86,29 @@ class QMWrapper(ABC):
         if charges is not None:
             self.external_charges = charges
 
+        self.atoms = tuple(atoms) if atoms is not None else None
+
         if self.qm_param is None:
             self.build_qm_param()
 
-        if minimize is True:
+        cache_key = self.get_cache_key(minimize) if self.cache_dir is not None else None
+
+        if (cache_key is not None and self.load_cached_info(cache_key) is True):
+            pass
+        elif minimize is True:
             geom = self.optimize_geometry()
+            if cache_key is not None:
+                self.save_cached_info(cache_key)
         else:
             self.compute_info()
+            if cache_key is not None:
+                self.save_cached_info(cache_key)
 
         self.info = {}
         self.info['energy'] = self.energy
         self.info['gradients'] = self.gradient
+        if self.charges is not None:
+            self.info['charges'] = self.charges
         
         return self.info
 
@@ -76,6 +116,11 @@ class QMWrapper(ABC):
     def get_geom_from_trajectory(self, qm_traj=None):
         """
         Obtains geometry information from an MDtrah trajectory object.
+        The coordinates in angstroms are saved as the numpy array self.qm_xyz
+        and the atomic numbers as the numpy array self.qm_atomic_numbers,
+        so the geometry can be handed to the QM program without formatting. 
+        A string of the geometry can be obtained with 
+        :func:`~janus.qm_wrapper.QMWrapper.get_geom_string` for debugging.
 
         Parameters
         ----------
@@ -84,28 +129,61 @@ class QMWrapper(ABC):
 
         """
 
-        out = ""
-        line = '{:3} {: > 7.3f} {: > 7.3f} {: > 7.3f} \n '
-        self.total_elec = 0.0
+        self.set_qm_arrays(np.asarray(qm_traj.xyz[0], dtype=np.float64) * 10,
+                           [atom.element.atomic_number for atom in qm_traj.topology.atoms],
+                           [atom.element.symbol for atom in qm_traj.topology.atoms])
 
-        for i in range(qm_traj.n_atoms):
-            x, y, z =   qm_traj.xyz[0][i][0],\
-                        qm_traj.xyz[0][i][1],\
-                        qm_traj.xyz[0][i][2]
+    def set_qm_arrays(self, xyz, atomic_numbers, symbols):
+        """
+        Sets the geometry of the primary subsystem from arrays, 
+        as used by :func:`~janus.qm_wrapper.QMWrapper.get_geom_from_trajectory`
 
-            symbol = qm_traj.topology.atom(i).element.symbol
-            n = mdlv.element(symbol).atomic_number
-            self.total_elec += n
-            
-            out += line.format(symbol, x*10, y*10, z*10)
+        Parameters
+        ----------
+        xyz : numpy array
+            coordinates of the atoms in angstroms
+        atomic_numbers : list
+            atomic numbers of the atoms
+        symbols : list
+            element symbols of the atoms
+        """
 
-        self.qm_geometry = out
+        self.qm_xyz = np.array(xyz, dtype=np.float64)
+        self.qm_symbols = list(symbols)
+        self.qm_atomic_numbers = np.array(atomic_numbers, dtype=int)
+        self.qm_geometry = None
+
+        self.total_elec = float(np.sum(self.qm_atomic_numbers))
 
         if self.total_elec % 2 != 0:
             self.total_elec += self.charge   # takes charge into account
             if self.total_elec % 2 != 0:
                 self.is_open_shelled = True
 
+    def get_geom_string(self):
+        """
+        Gets the geometry obtained from 
+        :func:`~janus.qm_wrapper.QMWrapper.get_geom_from_trajectory` 
+        as a string of XYZ coordinates in angstroms, rounded to 0.001 angstroms.
+        If the geometry was given as a string, returns that string.
+
+        Returns
+        -------
+        str
+            A str containing an XYZ coordinate 
+        """
+
+        if self.qm_xyz is None:
+            return self.qm_geometry
+
+        out = ""
+        line = '{:3} {: > 7.3f} {: > 7.3f} {: > 7.3f} \n '
+
+        for symbol, (x, y, z) in zip(self.qm_symbols, self.qm_xyz):
+            out += line.format(symbol, x, y, z)
+
+        return out
+
     def set_qm_geometry(self, geom):
         """
         Sets self.qm_geometry as geom
@@ -116,6 +194,9 @@ class QMWrapper(ABC):
             A str containing an XYZ coordinate 
         """
         self.qm_geometry = geom
+        self.qm_xyz = None
+        self.qm_atomic_numbers = None
+        self.qm_symbols = None
 
     @abstractmethod
     def compute_info(self):
@@ -138,6 +219,140 @@ class QMWrapper(ABC):
         """
         pass
 
+    def get_cache_key(self, minimize=False):
+        """
+        Gets the key of the current computation in the on-disk cache: 
+        a hash of the wrapper parameters (method, basis, charge, multiplicity 
+        and other options), the atomic numbers, the coordinates rounded to 
+        self.cache_tolerance angstroms, and the external charges rounded 
+        to self.cache_tolerance
+
+        Parameters
+        ----------
+        minimize : bool
+            whether the computation is a geometry optimization
+
+        Returns
+        -------
+        str
+            the hash as a hexadecimal string
+        """
+
+        # the cache and resource parameters do not change the results
+        param = {key : value for key, value in self.get_wrapper_param().items() 
+                 if not key.startswith('cache_') and key not in QMWrapper.resource_param}
+
+        cache_hash = hashlib.sha256(repr((self.class_type, sorted(param.items()), minimize)).encode())
+
+        if self.qm_xyz is not None:
+            cache_hash.update(np.asarray(self.qm_atomic_numbers, dtype=np.int64).tobytes())
+            cache_hash.update(np.round(self.qm_xyz / self.cache_tolerance).astype(np.int64).tobytes())
+        else:
+            cache_hash.update(self.qm_geometry.encode())
+
+        if self.external_charges is not None:
+            charges = np.asarray(self.external_charges, dtype=np.float64).reshape(-1, 4)
+            cache_hash.update(np.round(charges / self.cache_tolerance).astype(np.int64).tobytes())
+
+        return cache_hash.hexdigest()
+
+    def load_cached_info(self, cache_key):
+        """
+        Loads the energy, gradient and charges saved in the cache under cache_key
+        as self.energy, self.gradient and self.charges
+
+        Parameters
+        ----------
+        cache_key : str
+            key from :func:`~janus.qm_wrapper.QMWrapper.get_cache_key`
+
+        Returns
+        -------
+        bool
+            whether the results were found in the cache
+        """
+
+        cache_file = os.path.join(self.cache_dir, cache_key + '.npz')
+
+        try:
+            with np.load(cache_file) as cached:
+                self.energy = float(cached['energy'])
+                self.gradient = np.array(cached['gradients']) if 'gradients' in cached else None
+                self.charges = np.array(cached['charges']) if 'charges' in cached else None
+        except (IOError, ValueError, KeyError):
+            self.cache_info['misses'] += 1
+            return False
+
+        # mark as recently used
+        os.utime(cache_file)
+        self.cache_info['hits'] += 1
+        return True
+
+    def save_cached_info(self, cache_key):
+        """
+        Saves self.energy, self.gradient and self.charges in the cache under cache_key,
+        then removes the least recently used results until the cache 
+        is no larger than self.cache_size MB
+
+        Parameters
+        ----------
+        cache_key : str
+            key from :func:`~janus.qm_wrapper.QMWrapper.get_cache_key`
+        """
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        results = {'energy' : self.energy}
+        if self.gradient is not None:
+            results['gradients'] = self.gradient
+        if self.charges is not None:
+            results['charges'] = self.charges
+
+        # write to a temporary file first so other processes never read a partial file
+        fd, tmp_file = tempfile.mkstemp(suffix='.npz', dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **results)
+        os.replace(tmp_file, os.path.join(self.cache_dir, cache_key + '.npz'))
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.cache_size * 1024**2:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            self.cache_info['evictions'] += 1
+
+    def get_wrapper_param(self):
+        """
+        Function implemented in individual child classes
+        """
+        raise Exception('method not implemented for class')
+
+    def set_scratch_dir(self, scratch_dir):
+        """
+        Sets the directory for scratch files of the QM program. 
+        Does nothing unless implemented in individual child classes
+
+        Parameters
+        ----------
+        scratch_dir : str
+            path of the scratch directory
+        """
+        pass
+
     def get_main_info(self):
         """
         Function not implemented for QM wrappers
@@ -66,6 +66,19 @@ class AQMMM(ABC, QMMM):
         self.find_buffer_zone()
         self.find_configurations()
 
+        # the MM information of the entire system is the same for every partition,
+        # so it is computed once here and shared 
+        self.get_entire_sys_info(main_info)
+        self.allocate_qm_resources(len(self.systems[self.run_ID]))
+
+        if self.qm_workers > 0:
+            # the partitions are independent, so their high-level 
+            # computations are all submitted at once 
+            print('Submitting {} QM/MM partitions to {} workers'.format(len(self.systems[self.run_ID]), self.qm_workers))
+            for i, system in self.systems[self.run_ID].items():
+                self.qm_atoms = deepcopy(system.qm_atoms)
+                self.submit_hl_job(system, main_info)
+
         counter = 0
         for i, system in self.systems[self.run_ID].items():
             print('Running QM/MM partition {}'.format(counter))
@@ -1,5 +1,5 @@
 from janus.qmmm import AQMMM
-from janus.system import System
+from janus.system import System, ForceBuffer
 import numpy as np
 from copy import deepcopy
 
@@ -108,21 +108,18 @@ class BufferedForce(AQMMM):
     def run_aqmmm(system):
 
         qm_grad = system.primary_subsys['hl']['gradients']
-        qmmm_force = {}
-        # print('sys qm_atom', system.qm_atoms)
+        n_qm = len(self.qm_atoms)
             
-        # iterate over list of qm atoms
-        for i, atom in enumerate(self.qm_atoms):
-
-            # compute the qmmm gradient for the qm atoms: 
-            # mm_entire - mm_entire + qm
-            qmmm_force[atom] = np.zeros(3)
-            # these are in units of au_bohr, convert to openmm units in openmm wrapper
-            qmmm_force[atom] += -1 * (-system.entire_sys['gradients'][i] + qm_grad[i])
-            
-            # treating gradients for link atoms
-            if self.qmmm_boundary_bonds:
-                raise Exception('Buffered-Force method currently cannot treat link atoms')
+        # treating gradients for link atoms
+        if self.qmmm_boundary_bonds:
+            raise Exception('Buffered-Force method currently cannot treat link atoms')
+
+        # compute the qmmm gradient for the qm atoms: 
+        # mm_entire - mm_entire + qm
+        # these are in units of au_bohr, convert to openmm units in openmm wrapper
+        entire_grad = np.asarray(system.entire_sys['gradients'], dtype=np.float64).reshape(-1, 3)[:n_qm]
+        qm_grad = np.asarray(qm_grad, dtype=np.float64).reshape(-1, 3)[:n_qm]
+        qmmm_force = ForceBuffer(self.qm_atoms, -1 * (-entire_grad + qm_grad))
                                 
         system.qmmm_forces = qmmm_force
 
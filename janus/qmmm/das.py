@@ -1,5 +1,5 @@
 from janus.qmmm import AQMMM
-from janus.system import System
+from janus.system import System, ForceBuffer
 from copy import deepcopy
 import numpy as np
 import itertools as it
@@ -97,35 +97,27 @@ class DAS(AQMMM):
 
             # getting first term of ap energy and forces (w/o gradient of switching function)
             qm.aqmmm_energy = deepcopy(qm.qmmm_energy)
-            qm.aqmmm_forces = deepcopy(qm.qmmm_forces)
             
             dis = sorted(self.buffer_distance, key=self.buffer_distance.get)
             sigma = self.buffer_groups[dis[0]].s_i
             qm.aqmmm_energy *= sigma
-            qm.aqmmm_forces.update((x, y*sigma) for x,y in qm.aqmmm_forces.items())
+            qm.aqmmm_forces = ForceBuffer.from_forces(qm.qmmm_forces).scaled(sigma)
 
             energy = deepcopy(qm.aqmmm_energy)
-            qmmm_forces = deepcopy(qm.aqmmm_forces)
+            qmmm_forces = qm.aqmmm_forces.copy()
 
             # getting rest of the terms of ap energy and forces (w/o gradient of switching function)
             for i, part in enumerate(self.partitions):
 
                 sys = self.systems[self.run_ID][i]
                 sys.aqmmm_energy = sys.qmmm_energy * sys.sigma
-
-                sys.aqmmm_forces = deepcopy(sys.qmmm_forces)
-                sys.aqmmm_forces.update((x, y*sys.sigma) for x,y in sys.aqmmm_forces.items())
+                sys.aqmmm_forces = ForceBuffer.from_forces(sys.qmmm_forces).scaled(sys.sigma)
 
                 energy += sys.aqmmm_energy
 
             # combining all forces
             for i, part in enumerate(self.partitions):
-                forces = self.systems[self.run_ID][i].aqmmm_forces
-                for j, force in forces.items():
-                    if j in qmmm_forces:
-                        qmmm_forces[j] += force
-                    else:
-                        qmmm_forces[j] = force
+                qmmm_forces.add(self.systems[self.run_ID][i].aqmmm_forces)
 
 
             # need to deal with bookkeeping term
@@ -1,5 +1,5 @@
 from janus.qmmm import AQMMM
-from janus.system import System
+from janus.system import System, ForceBuffer
 import numpy as np
 from copy import deepcopy
 
@@ -83,10 +83,10 @@ class HotSpot(AQMMM):
 
         else:
 
-            forces = deepcopy(qm.qmmm_forces)
+            forces = ForceBuffer.from_forces(qm.qmmm_forces).copy()
             for i, buf in self.buffer_groups.items():
-                for idx in buf.atoms:
-                    forces[idx] *= buf.s_i
+                rows = forces.get_rows(buf.atoms)
+                forces.forces[rows] *= buf.s_i
 
             self.systems[self.run_ID]['qmmm_forces'] = forces
 
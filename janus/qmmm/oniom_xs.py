@@ -1,5 +1,5 @@
 from janus.qmmm import AQMMM
-from janus.system import System
+from janus.system import System, ForceBuffer
 import numpy as np
 
 class OniomXS(AQMMM):
@@ -93,12 +93,11 @@ class OniomXS(AQMMM):
 
             # needs work!
             # computing gradients
-            forces = {}
-            for f, coord in qm_bz.qmmm_forces.items():
-                if f in qm.qmmm_forces:
-                    forces[f] = lamda*coord + (1-lamda)*qm.qmmm_forces[f] 
-                else: 
-                    forces[f] = lamda*coord
+            forces = ForceBuffer.from_forces(qm_bz.qmmm_forces).scaled(lamda)
+            qm_forces = ForceBuffer.from_forces(qm.qmmm_forces)
+            # only the atoms of the qm partition that are also in the qm_bz partition
+            in_bz = np.isin(qm_forces.indices, forces.indices)
+            forces.add_forces(qm_forces.indices[in_bz], qm_forces.forces[in_bz], scale=1-lamda)
 
             # computing gradient of switching function
             scaler = (qm_bz.qmmm_energy - qm.qmmm_energy) / len(qm_bz.buffer_groups)
@@ -1,5 +1,5 @@
 from janus.qmmm import AQMMM
-from janus.system import System
+from janus.system import System, ForceBuffer
 import itertools as it
 from copy import deepcopy
 import numpy as np
@@ -99,31 +99,34 @@ class PAP(AQMMM):
 
             # getting first term of ap energy and forces (w/o gradient of switching function)
             qm.aqmmm_energy = deepcopy(qm.qmmm_energy)
-            qm.aqmmm_forces = deepcopy(qm.qmmm_forces)
+            scale = 1.0
 
             for i, buf in self.buffer_groups.items():
 
                 qm.aqmmm_energy *= (1 - buf.s_i)
-                qm.aqmmm_forces.update((x, y*(1 - buf.s_i)) for x,y in qm.aqmmm_forces.items())
+                scale *= (1 - buf.s_i)
+
+            qm.aqmmm_forces = ForceBuffer.from_forces(qm.qmmm_forces).scaled(scale)
 
             energy = deepcopy(qm.aqmmm_energy)
-            qmmm_forces = deepcopy(qm.aqmmm_forces)
+            qmmm_forces = qm.aqmmm_forces.copy()
 
             # getting rest of the terms of ap energy and forces (w/o gradient of switching function)
             for i, part in enumerate(self.partitions):
 
                 sys = self.systems[self.run_ID][i]
                 sys.aqmmm_energy = deepcopy(sys.qmmm_energy)
-                sys.aqmmm_forces = deepcopy(sys.qmmm_forces)
+                scale = 1.0
 
                 for j, buf in self.buffer_groups.items():
                     if j in part:
                         sys.aqmmm_energy *= buf.s_i
-                        sys.aqmmm_forces.update((x, y*buf.s_i) for x,y in sys.aqmmm_forces.items())
+                        scale *= buf.s_i
                     else:
                         sys.aqmmm_energy *= (1 - buf.s_i)
-                        sys.aqmmm_forces.update((x, y*(1 - buf.s_i)) for x,y in sys.aqmmm_forces.items())
+                        scale *= (1 - buf.s_i)
 
+                sys.aqmmm_forces = ForceBuffer.from_forces(sys.qmmm_forces).scaled(scale)
                 energy += sys.aqmmm_energy
 
             if self.modified_variant is False:
@@ -131,20 +134,11 @@ class PAP(AQMMM):
                 forces_sf = self.compute_sf_gradient()
 
                 # adding forces to total forces
-                for i, force in forces_sf.items():
-                    if i in qmmm_forces:
-                        qmmm_forces[i] += force
-                    else:
-                        qmmm_forces[i] = force
+                qmmm_forces.add(forces_sf)
 
             # combining all forces
             for i, part in enumerate(self.partitions):
-                forces = self.systems[self.run_ID][i].aqmmm_forces
-                for j, force in forces.items():
-                    if j in qmmm_forces:
-                        qmmm_forces[j] += force
-                    else:
-                        qmmm_forces[j] = force
+                qmmm_forces.add(self.systems[self.run_ID][i].aqmmm_forces)
 
             self.systems[self.run_ID]['qmmm_forces'] = qmmm_forces
             self.systems[self.run_ID]['qmmm_energy'] = energy
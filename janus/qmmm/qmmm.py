@@ -1,7 +1,10 @@
 from copy import deepcopy
+from collections import OrderedDict
 import numpy as np
 import mdtraj as md
-from janus.system import System
+import os
+from janus.system import System, ForceBuffer
+from janus.qm_wrapper import QMExecutor
 
 class QMMM(object):
     """
@@ -33,9 +36,63 @@ class QMMM(object):
         link_atom_element : str 
             Element to use for link atom, default is H. 
             Beware of using others (not all functionality tested)
+        use_main_info : bool
+            Whether to take the MM energy and gradients of the entire system
+            from main_info (the MD simulation) instead of computing them 
+            with ll_wrapper. main_info then needs to be made with 
+            :func:`~janus.mm_wrapper.OpenMMWrapper.get_main_info` with include_mm=True, 
+            as :func:`~janus.driver.run_single_point` does. Default is False.
+        embedding_cutoff : float
+            Distance in angstroms from the QM atoms beyond which the MM point charges 
+            of electrostatic embedding are compressed into monopole and dipole sites 
+            per residue, see :func:`~janus.qmmm.QMMM.truncate_external_charges`. 
+            Default is None, which uses every MM point charge
+        embedding_switch_width : float
+            Width in angstroms of the region inside embedding_cutoff over which 
+            the point charges are smoothly switched from explicit to compressed. 
+            Default is 1.0
+        embedding_outer_cutoff : float
+            Distance in angstroms from the QM atoms beyond which residues compressed 
+            with embedding_cutoff are left out, so the number of point charges 
+            only depends on the environment of the QM atoms and not on the size of the box. 
+            Should be larger than embedding_cutoff. Default is None, which keeps every compressed residue
+        embedding_error_interval : int
+            Number of steps between computations of the error of the potential and field 
+            at the QM atoms from compressing the point charges with embedding_cutoff, 
+            see :func:`~janus.qmmm.QMMM.get_embedding_error`. The error is computed on 
+            the first step and every embedding_error_interval steps after. 
+            Default is 0, which does not compute it
+        qm_workers : int
+            Number of worker processes in which to run the high-level computations, 
+            see :class:`~janus.qm_wrapper.QMExecutor`. With adaptive QM/MM, 
+            the high-level computations of all partitions are run at the same time.
+            The workers are stopped by :func:`~janus.qmmm.QMMM.close` or at the end 
+            of a with block. Default is 0, which runs them in this process with hl_wrapper
+        qm_scratch_dir : str
+            Directory in which the scratch directories of the worker processes 
+            are made. Default is None, which uses the default temporary directory
+        qm_resource_policy : str
+            How to set the threads and memory of the high-level computations. 
+            auto divides the cores and memory between the high-level computations 
+            that run at the same time and the threads of OpenMM every step, 
+            see :func:`~janus.qmmm.QMMM.allocate_qm_resources`. 
+            Default is None, which leaves them to hl_wrapper
+        qm_total_threads : int
+            Number of cores to divide with the auto policy. Default is None, 
+            which uses the cores this process may run on
+        qm_total_memory : float
+            Memory in MB to divide between high-level computations with the auto policy. 
+            Default is None, which uses half of the physical memory
+        subsys_cache_size : int
+            Number of sets of QM atoms for which the topology and link atoms 
+            of the primary subsystem are saved, see 
+            :func:`~janus.qmmm.QMMM.get_primary_subsys_layout`. Default is 256
         
     """
 
+    # scale factors of link atoms by the elements of the broken bond and link atom
+    scale_factors = {}
+
     def __init__(self, hl_wrapper, 
                        ll_wrapper, 
                        sys_info,
@@ -44,7 +101,18 @@ class QMMM(object):
                        qmmm_scheme='subtractive', 
                        embedding_method='Mechanical', 
                        boundary_treatment='link_atom',
-                       link_atom_element='H'):
+                       link_atom_element='H',
+                       use_main_info=False,
+                       embedding_cutoff=None,
+                       embedding_switch_width=1.0,
+                       embedding_outer_cutoff=None,
+                       embedding_error_interval=0,
+                       qm_workers=0,
+                       qm_scratch_dir=None,
+                       qm_resource_policy=None,
+                       qm_total_threads=None,
+                       qm_total_memory=None,
+                       subsys_cache_size=256):
         
         self.class_type = 'QMMM'
         self.hl_wrapper = hl_wrapper
@@ -55,15 +123,44 @@ class QMMM(object):
         self.traj = self.convert_input(sys_info, sys_info_format)
         self.topology = self.traj.topology
         self.positions = self.traj.xyz[0]
+        # topology from which self.topology was last converted in update_traj
+        self.source_topology = None
 
         self.qm_atoms = qm_atoms
         self.qmmm_scheme = qmmm_scheme
         self.embedding_method = embedding_method
         self.boundary_treatment = boundary_treatment
         self.link_atom_element = link_atom_element
+        self.use_main_info = use_main_info
+        self.embedding_cutoff = embedding_cutoff
+        self.embedding_switch_width = embedding_switch_width
+        self.embedding_outer_cutoff = embedding_outer_cutoff
+        self.embedding_error_interval = embedding_error_interval
+        self.embedding_error = None
+        self.qm_workers = qm_workers
+        self.qm_scratch_dir = qm_scratch_dir
+        self.qm_executor = None
+        self.qm_resource_policy = qm_resource_policy
+        self.qm_total_threads = qm_total_threads
+        self.qm_total_memory = qm_total_memory
+        self.qm_resources = None
+        self.subsys_cache_size = subsys_cache_size
 
         self.systems = {}
 
+        # information that is the same for every partition of a step
+        self.entire_sys = None
+        self.main_charges = None
+        self.charge_array = None
+        self.bond_indices = None
+        self.adjacency = None
+        # primary subsystems by the set of QM atoms
+        self.subsys_cache = OrderedDict()
+        # secondary subsystems by the set of QM atoms
+        self.second_subsys_cache = OrderedDict()
+        self.atom_residues = None
+        self.atom_residues_topology = None
+
     def run_qmmm(self, main_info, wrapper_type):
         """
         Drives QM/MM computation.
@@ -83,6 +180,11 @@ class QMMM(object):
 
         system = System(qm_indices=self.qm_atoms, qm_residues=None, run_ID=self.run_ID)
 
+        self.allocate_qm_resources(1)
+
+        if self.qm_workers > 0:
+            self.submit_hl_job(system, main_info)
+
         if self.embedding_method =='Mechanical':
             self.mechanical(system, main_info)
         elif self.embedding_method =='Electrostatic':
@@ -111,7 +213,12 @@ class QMMM(object):
     def update_traj(self, position, topology, wrapper_type):
         """
         Updates the positions and topology of self.traj,
-        a MDtraj trajectory object
+        a MDtraj trajectory object.
+
+        The topology is only converted the first time it is given, 
+        or if a different topology is given. Otherwise the positions 
+        are written into self.traj in place, so objects that hold self.traj, 
+        such as the buffer partition, see the new positions
 
         Parameters
         ----------
@@ -123,17 +230,36 @@ class QMMM(object):
             Defines the program used to obtain topology and positions
 
        """ 
-        # later can think about saving instead of making new instance
-        # convert openmm topology to mdtraj topology
-        if wrapper_type == 'OpenMM':
-            top = md.Topology.from_openmm(topology)
-        for atom in top.atoms:
-            atom.serial = atom.index + 1
-
-        self.traj = md.Trajectory(position, top)
-        self.topology = self.traj.topology
+
+        if (topology is not self.source_topology or self.traj.n_atoms != len(position)):
+            # convert openmm topology to mdtraj topology
+            if wrapper_type == 'OpenMM':
+                top = md.Topology.from_openmm(topology)
+            for atom in top.atoms:
+                atom.serial = atom.index + 1
+
+            if self.traj.n_atoms == top.n_atoms:
+                self.traj.topology = top
+            else:
+                self.traj = md.Trajectory(np.zeros((1, top.n_atoms, 3), dtype=np.float32), top)
+
+            # positions are given without box vectors
+            self.traj.unitcell_vectors = None
+            self.topology = self.traj.topology
+            self.source_topology = topology
+            # bonds are taken from the new topology
+            self.bond_indices = None
+            self.adjacency = None
+            self.subsys_cache = OrderedDict()
+            self.second_subsys_cache = OrderedDict()
+
+        self.traj.xyz[0] = position
         self.positions = self.traj.xyz[0]
 
+        # the entire system has moved, so its MM information needs to be recomputed
+        self.entire_sys = None
+        self.charge_array = None
+
 
     def mechanical(self, system, main_info):
         """
@@ -154,7 +280,7 @@ class QMMM(object):
 
         if self.qmmm_scheme == 'subtractive':
             # Get MM energy on whole system
-            system.entire_sys = self.ll_wrapper.get_energy_and_gradient(self.traj)
+            system.entire_sys = self.get_entire_sys_info(main_info)
             print('entire', system.entire_sys['energy'])
 
             #print(system.entire_sys['energy'])
@@ -163,12 +289,13 @@ class QMMM(object):
             traj_ps, link_indices = self.make_primary_subsys_trajectory(qm_atoms=system.qm_atoms)
             system.primary_subsys['trajectory'] = traj_ps
             print('getting mm energy and gradient of qm region')
-            system.primary_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ps, include_coulomb='no_link', link_atoms=link_indices)
+            system.primary_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ps, include_coulomb='no_link', link_atoms=link_indices,
+                                                                                  atoms=self.get_primary_subsys_atoms(system.qm_atoms))
             print('ll', system.primary_subsys['ll']['energy'])
 
             # Get QM energy
             print('getting qm energy and gradient of qm region')
-            system.primary_subsys['hl'] = self.hl_wrapper.get_energy_and_gradient(traj_ps)
+            system.primary_subsys['hl'] = self.get_hl_info(system, traj_ps, link_indices)
             print('hl', system.primary_subsys['hl']['energy'])
             print('hl', system.primary_subsys['hl']['gradients'])
 
@@ -202,22 +329,22 @@ class QMMM(object):
         if self.qmmm_scheme == 'subtractive':
 
             # Get MM energy on whole system
-            system.entire_sys = self.ll_wrapper.get_energy_and_gradient(self.traj)
+            system.entire_sys = self.get_entire_sys_info(main_info)
             print('entire', system.entire_sys['energy'])
 
             # Get MM energy on QM region
             traj_ps, link_indices = self.make_primary_subsys_trajectory(qm_atoms=system.qm_atoms)
             system.primary_subsys['trajectory'] = traj_ps
-            system.primary_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ps, include_coulomb=None)
+            system.primary_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ps, include_coulomb=None, link_atoms=link_indices,
+                                                                                  atoms=self.get_primary_subsys_atoms(system.qm_atoms))
 
             # Get MM coulomb energy on secondary subsystem
             traj_ss = self.make_second_subsys_trajectory()
             system.second_subsys['trajectory'] = traj_ss
-            system.second_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ss, include_coulomb='only')
+            system.second_subsys['ll'] = self.ll_wrapper.get_energy_and_gradient(traj_ss, include_coulomb='only', atoms=self.mm_atoms)
 
             # Get QM energy
-            charges = self.get_external_charges(system)
-            system.primary_subsys['hl'] = self.hl_wrapper.get_energy_and_gradient(traj_ps, charges=charges)
+            system.primary_subsys['hl'] = self.get_hl_info(system, traj_ps, link_indices)
 
             # Compute the total QM/MM energy based on
             # subtractive Mechanical embedding
@@ -231,6 +358,321 @@ class QMMM(object):
         else:
             print('only a subtractive scheme is implemented at this time')
 
+    def allocate_qm_resources(self, n_jobs):
+        """
+        Divides the cores and memory between the high-level computations 
+        of a step if self.qm_resource_policy is auto, and sets the threads 
+        and memory of hl_wrapper accordingly. At most self.qm_workers 
+        computations run at the same time, or one if self.qm_workers is 0. 
+        With worker processes, the high-level computations run at the same 
+        time as the OpenMM computations of this process, so the OpenMM threads 
+        of ll_wrapper are set aside first. The allocation is printed every step
+
+        Parameters
+        ----------
+        n_jobs : int
+            number of high-level computations in the step
+
+        Returns
+        -------
+        dict
+            the number of concurrent computations('concurrent_jobs'), 
+            threads('num_threads') and memory in bytes('memory') of each computation,
+            and the threads set aside for OpenMM('mm_threads'), 
+            None if no policy is used
+        """
+
+        if self.qm_resource_policy is None:
+            return None
+        elif self.qm_resource_policy != 'auto':
+            raise ValueError("Only the auto qm_resource_policy currently available")
+
+        if self.qm_total_threads is not None:
+            total_threads = self.qm_total_threads
+        elif hasattr(os, 'sched_getaffinity'):
+            total_threads = len(os.sched_getaffinity(0))
+        else:
+            total_threads = os.cpu_count()
+
+        if self.qm_total_memory is not None:
+            total_memory = self.qm_total_memory * 1024**2
+        else:
+            total_memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2
+
+        if self.qm_workers > 0:
+            concurrent_jobs = max(1, min(self.qm_workers, n_jobs))
+            properties = getattr(self.ll_wrapper, 'platform_properties', None) or {}
+            mm_threads = int(properties.get('Threads', 1))
+        else:
+            concurrent_jobs = 1
+            mm_threads = 0
+
+        resources = {}
+        resources['concurrent_jobs'] = concurrent_jobs
+        resources['mm_threads'] = mm_threads
+        resources['num_threads'] = max(1, (total_threads - mm_threads) // concurrent_jobs)
+        resources['memory'] = int(total_memory / concurrent_jobs)
+
+        self.hl_wrapper.num_threads = resources['num_threads']
+        self.hl_wrapper.memory = resources['memory']
+
+        print('QM resources for step {}: {} concurrent computations of {} threads and {:.0f} MB each, {} OpenMM threads, {} cores'.format(
+               self.run_ID, concurrent_jobs, resources['num_threads'], resources['memory'] / 1024**2, mm_threads, total_threads))
+        if concurrent_jobs * resources['num_threads'] + mm_threads > total_threads:
+            print('Warning: {} threads are used on {} cores'.format(concurrent_jobs * resources['num_threads'] + mm_threads, total_threads))
+
+        self.qm_resources = resources
+        return resources
+
+    def get_hl_info(self, system, traj_ps, link_indices):
+        """
+        Gets the high-level energy and gradients of the primary subsystem,
+        either from the job submitted by :func:`~janus.qmmm.QMMM.submit_hl_job`
+        or by computing them with hl_wrapper, including the external 
+        point charges for electrostatic embedding
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system in which to save qmmm energy and forces
+        traj_ps : MDtraj trajectory object
+            trajectory of the primary subsystem
+        link_indices : list
+            The link atom indices in traj_ps
+
+        Returns
+        -------
+        dict
+            A dictionary with energy('energy') and gradient('gradients') information
+        """
+
+        if 'hl_job' in system.primary_subsys:
+            return system.primary_subsys.pop('hl_job').get()
+
+        charges = self.get_external_charges(system)
+        return self.hl_wrapper.get_energy_and_gradient(traj_ps, charges=charges, link_atoms=link_indices,
+                                                       atoms=self.get_primary_subsys_atoms(system.qm_atoms))
+
+    def submit_hl_job(self, system, main_info):
+        """
+        Submits the high-level computation of the primary subsystem of system
+        to the worker processes of self.qm_executor, which is created on the first call.
+        The result is picked up by :func:`~janus.qmmm.QMMM.get_hl_info`, 
+        so several systems can be submitted before any is computed
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system in which to save qmmm energy and forces
+        main_info : dict 
+            contains the energy and forces for the whole system
+        """
+
+        if self.qm_executor is None:
+            self.qm_executor = QMExecutor(self.qm_workers, scratch_dir=self.qm_scratch_dir)
+
+        system.entire_sys = self.get_entire_sys_info(main_info)
+        traj_ps, link_indices = self.make_primary_subsys_trajectory(qm_atoms=system.qm_atoms)
+        charges = self.get_external_charges(system)
+
+        job = self.qm_executor.make_job(self.hl_wrapper, traj_ps, charges=charges, 
+                                        atoms=self.get_primary_subsys_atoms(system.qm_atoms))
+        system.primary_subsys['hl_job'] = self.qm_executor.submit(job)
+
+    def close(self):
+        """
+        Stops the worker processes of the high-level computations, if any, 
+        and removes their scratch directories. A later call to 
+        :func:`~janus.qmmm.QMMM.submit_hl_job` starts new worker processes
+        """
+
+        if self.qm_executor is not None:
+            self.qm_executor.close()
+            self.qm_executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_entire_sys_info(self, main_info=None):
+        """
+        Gets the MM energy and gradients of the entire system.
+        If self.use_main_info is True, these are taken from main_info, 
+        where the contribution of the qmmm force has been excluded. 
+        Otherwise they are computed with ll_wrapper, 
+        reusing the same MM objects every step.
+        This is only done once per step, and the result is shared
+        by all partitions of the step.
+
+        Parameters
+        ----------
+        main_info : dict 
+            contains the energy and forces for the whole system
+
+        Returns
+        -------
+        dict
+            A dictionary with energy('energy') and gradient('gradients') information
+
+        """
+
+        if self.entire_sys is not None:
+            return self.entire_sys
+
+        if (self.use_main_info is True and main_info is not None and 'mm_gradients' in main_info):
+            entire_sys = {}
+            entire_sys['energy'] = main_info['mm_potential']
+            entire_sys['potential'] = main_info['mm_potential']
+            entire_sys['kinetic'] = main_info['kinetic']
+            entire_sys['positions'] = main_info['positions']
+            entire_sys['forces'] = main_info['mm_forces']
+            entire_sys['gradients'] = main_info['mm_gradients']
+        else:
+            entire_sys = self.ll_wrapper.get_energy_and_gradient(self.traj, atoms=range(self.traj.n_atoms))
+
+        self.entire_sys = entire_sys
+
+        return self.entire_sys
+
+    def get_main_charges(self):
+        """
+        Gets the MM point charges of the entire system from ll_wrapper.
+        The charges do not change during a simulation, so they are only
+        obtained once and shared by all partitions.
+
+        Returns
+        -------
+        numpy array
+            charges of the entire system
+
+        """
+
+        if self.main_charges is None:
+            charges = self.ll_wrapper.get_main_charges()
+            if charges is None:
+                return None
+            self.main_charges = np.asarray(charges)
+
+        return self.main_charges
+
+    def get_charge_array(self, system):
+        """
+        Gets the MM point charges of the entire system with their positions.
+        The positions of the entire system are the same for every partition 
+        of a step, so the array is only made once for them.
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system whose entire_sys positions to use
+
+        Returns
+        -------
+        numpy array
+            positions of the entire system in angstroms
+        numpy array
+            (N,4) array of charges and corresponding positions in angstroms 
+            of the entire system
+        """
+
+        positions = system.entire_sys['positions']
+
+        if self.charge_array is None or self.charge_array[0] is not positions:
+            # in angstroms
+            es_pos = 10*positions
+            charges = np.zeros((len(es_pos), 4))
+            charges[:, 0] = self.get_main_charges()
+            charges[:, 1:] = es_pos
+            self.charge_array = (positions, es_pos, charges)
+
+        return self.charge_array[1], self.charge_array[2]
+
+    def get_bond_indices(self):
+        """
+        Gets the atom indices of every bond in the entire system.
+        The bonds do not change during a simulation, so they are only 
+        obtained once and shared by all partitions.
+
+        Returns
+        -------
+        numpy array
+            bonded atom indices with shape (number of bonds, 2)
+
+        """
+
+        if self.bond_indices is None:
+            bonds = [[bond[0].index, bond[1].index] for bond in self.topology.bonds]
+            self.bond_indices = np.array(bonds, dtype=int).reshape(-1, 2)
+
+        return self.bond_indices
+
+    def get_adjacency(self):
+        """
+        Gets an index of the atoms bonded to each atom in the entire system
+        in compressed sparse row (CSR) format, so the bonds of a set of atoms 
+        are found in time proportional to its size. The bonded atoms of atom i 
+        are neighbors[indptr[i]:indptr[i+1]], in the order of the bonds 
+        in the topology. Only built once, like the bond indices.
+
+        Returns
+        -------
+        numpy array
+            indptr, the offsets of the bonded atoms of each atom
+        numpy array
+            neighbors, the indices of the bonded atoms 
+        numpy array
+            the index in :func:`~janus.qmmm.QMMM.get_bond_indices` of the bond 
+            to each of the neighbors
+        """
+
+        if self.adjacency is None:
+            bonds = self.get_bond_indices()
+            n_atoms = self.topology.n_atoms
+            ids = np.arange(len(bonds))
+
+            atoms = np.concatenate([bonds[:, 0], bonds[:, 1]])
+            neighbors = np.concatenate([bonds[:, 1], bonds[:, 0]])
+            bond_ids = np.concatenate([ids, ids])
+            order = np.lexsort((bond_ids, atoms))
+
+            indptr = np.zeros(n_atoms + 1, dtype=int)
+            indptr[1:] = np.cumsum(np.bincount(atoms, minlength=n_atoms))
+
+            self.adjacency = (indptr, neighbors[order], bond_ids[order])
+            # mask of the qm atoms, used and cleared by find_boundary_bonds
+            self.in_qm = np.zeros(n_atoms, dtype=bool)
+
+        return self.adjacency
+
+    def get_scale_factor_g(self, qm, mm, link):
+        """
+        Gets the scale factor g of a link atom from 
+        :func:`~janus.system.System.compute_scale_factor_g`, 
+        which is only computed once for each set of elements
+
+        Parameters
+        ----------
+        qm : str
+            element symbol of the QM atom involved in broken bond 
+        mm : str
+            element symbol of the MM atom involved in broken bond 
+        link : str
+            element symbol for link atom
+
+        Returns
+        -------
+        float
+            g, the scaling factor
+        """
+
+        key = (qm, mm, link)
+        if key not in QMMM.scale_factors:
+            QMMM.scale_factors[key] = System.compute_scale_factor_g(qm, mm, link)
+
+        return QMMM.scale_factors[key]
+
     def compute_gradients(self, system):
         """
         Computes the QM/MM gradients 
@@ -250,56 +692,41 @@ class QMMM(object):
 
         if self.qmmm_scheme == 'subtractive':
 
-            entire_grad = system.entire_sys['gradients']
             ps_mm_grad, qm_grad = system.primary_subsys['ll']['gradients'], system.primary_subsys['hl']['gradients']
-            #print('ps_mm', ps_mm_grad)
-            #print('qm', qm_grad)
-            qmmm_force = {}
-           # print('sys qm_atom', system.qm_atoms)
+            # qm - mm gradients of the primary subsystem, 
+            # in units of au_bohr, convert to openmm units in openmm wrapper
+            ps_grad = np.asarray(qm_grad, dtype=np.float64).reshape(-1, 3) - np.asarray(ps_mm_grad, dtype=np.float64).reshape(-1, 3)
+
+            # compute the qmmm gradient for the qm atoms: 
+            # mm_entire - mm_primary + qm, where mm_entire is already in the md simulation
+            # multiply by -1 to get from gradients to forces
+            qm_atoms = np.asarray(system.qm_atoms, dtype=int)
+            qmmm_force = ForceBuffer(qm_atoms, -1 * ps_grad[:len(qm_atoms)])
                 
-            # iterate over list of qm atoms
-            for i, atom in enumerate(system.qm_atoms):
-
-                # compute the qmmm gradient for the qm atoms: 
-                # mm_entire - mm_primary + qm
-                # multiply by -1 to get from gradients to forces
-                # these are in units of au_bohr, convert to openmm units in openmm wrapper
-                #qmmm_force[atom] = -1 * (entire_grad[atom] - ps_mm_grad[i] + qm_grad[i])
-                print(atom, 'mm ps', -1*ps_mm_grad[i]*self.ll_wrapper.au_bohr_to_kjmol_nm)
-                print(atom, 'qm ps', -1*qm_grad[i]*self.ll_wrapper.au_bohr_to_kjmol_nm)
-                print(atom, 'entire', -1*entire_grad[atom]*self.ll_wrapper.au_bohr_to_kjmol_nm)
-                qmmm_force[atom] = -1 * (- ps_mm_grad[i] + qm_grad[i])
-                
-                # treating gradients for link atoms
-                if self.qmmm_boundary_bonds:
-                    for j, link in self.link_atoms.items():
-                        if isinstance(j, int):
-                            q1 = link['qm_atom'].index
-                            m1 = link['mm_atom'].index
-                            link_index = link['link_atom_index']
-                            g = link['scale_factor'] 
-                            if atom == q1:
-                                if self.boundary_treatment == 'link_atom':
-                                    # Project forces of link atoms onto the mm and qm atoms of the link atom bond
-                                    # need to make sure sign is correct
-                                    qmmm_force[q1] += -(1 - g) * ps_mm_grad[link_index] + (1 - g) * qm_grad[link_index]
-                                    qmmm_force[m1] = -g * ps_mm_grad[link_index] + g * qm_grad[link_index]
-                                    
-                            # # Forces on M2 requires forces on point charges which I'm not sure about so need to double check
-                            # if self.boundary_treatment == 'RC' or self.boundary_treatment == 'RCD':
-                            #     qmmm_force[atom] += -(1 - g) * ps_mm_grad[-1] + (1 - g) * qm_grad[-1]
-                            #     qmmm_force[m1] += -g * ps_mm_grad[-1] + g * qm_grad[-1]
-
-            # MM atoms
-           # for a in range(len(entire_grad)):
-           #     if a not in system.qm_atoms:
-           #         qmmm_force[a] = -1 * entire_grad[a]
-
+            # treating gradients for link atoms
+            if self.qmmm_boundary_bonds and self.boundary_treatment == 'link_atom':
+                links = [link for j, link in self.link_atoms.items() if isinstance(j, int)]
+                q1 = np.array([link['qm_atom'].index for link in links], dtype=int)
+                m1 = np.array([link['mm_atom'].index for link in links], dtype=int)
+                g = np.array([link['scale_factor'] for link in links])[:, None]
+                link_grad = ps_grad[[link['link_atom_index'] for link in links]]
+
+                # in the order of the qm atoms, so the last link atom of an mm atom sets its forces
+                order = np.argsort([np.where(qm_atoms == q)[0][0] for q in q1], kind='stable')
+
+                # Project forces of link atoms onto the mm and qm atoms of the link atom bond
+                # need to make sure sign is correct
+                qmmm_force.add_forces(q1, (1 - g) * link_grad)
+                qmmm_force.set_forces(m1[order], (g * link_grad)[order])
+
+                # # Forces on M2 requires forces on point charges which I'm not sure about so need to double check
+                # if self.boundary_treatment == 'RC' or self.boundary_treatment == 'RCD':
+                #     qmmm_force[atom] += -(1 - g) * ps_mm_grad[-1] + (1 - g) * qm_grad[-1]
+                #     qmmm_force[m1] += -g * ps_mm_grad[-1] + g * qm_grad[-1]
 
             if 'll' in system.second_subsys:
-                # iterate over list of mm atoms
-                for i, atom in enumerate(self.mm_atoms):
-                    qmmm_force[atom] = -1 * system.second_subsys['ll']['gradients'][i]
+                # mm atoms
+                qmmm_force.set_forces(self.mm_atoms, -1 * np.asarray(system.second_subsys['ll']['gradients'], dtype=np.float64).reshape(-1, 3))
 
             system.qmmm_forces = qmmm_force
         
@@ -324,22 +751,24 @@ class QMMM(object):
             qm_atoms = self.qm_atoms
 
         self.qmmm_boundary_bonds = []
-        # determining if there are bonds that need to be cut
-        for bond in self.topology.bonds:
-            # find any bonds that involve the qm atoms
-            # iterates over tuple of mdtraj atom objects
-            if (bond[0].index in qm_atoms or bond[1].index in qm_atoms):
-                # isolate bonds that involve one in the qm atoms and one outside
-                if (bond[0].index not in qm_atoms or bond[1].index not in qm_atoms):
-                    qm_atom = {}
-                    mm_atom = {}
-                    if bond[0].index in qm_atoms:
-                        qm_atom = bond[0]
-                        mm_atom = bond[1]
-                    else:
-                        qm_atom = bond[1]
-                        mm_atom = bond[0]
-                    self.qmmm_boundary_bonds.append((qm_atom, mm_atom))
+        indptr, neighbors, bond_ids = self.get_adjacency()
+        qm_atoms = np.unique(np.asarray(qm_atoms, dtype=int))
+
+        # neighbors of the qm atoms from the adjacency index 
+        counts = indptr[qm_atoms + 1] - indptr[qm_atoms]
+        entries = np.repeat(indptr[qm_atoms] - np.cumsum(counts) + counts, counts) + np.arange(np.sum(counts))
+        qm_side = np.repeat(qm_atoms, counts)
+
+        # determining if there are bonds that need to be cut:
+        # isolate bonds that involve one in the qm atoms and one outside
+        self.in_qm[qm_atoms] = True
+        cut = ~self.in_qm[neighbors[entries]]
+        self.in_qm[qm_atoms] = False
+
+        # in the order of the bonds in the topology
+        order = np.argsort(bond_ids[entries][cut], kind='stable')
+        for q, m in zip(qm_side[cut][order], neighbors[entries][cut][order]):
+            self.qmmm_boundary_bonds.append((self.topology.atom(int(q)), self.topology.atom(int(m))))
 
 
     def prepare_link_atom(self):
@@ -365,21 +794,16 @@ class QMMM(object):
             self.link_atoms['all_mm'].append(mm.index)
 
             self.link_atoms[i]['link_atom'] = self.link_atom_element
-            g = System.compute_scale_factor_g(qm.element.symbol, mm.element.symbol, self.link_atom_element)
+            g = self.get_scale_factor_g(qm.element.symbol, mm.element.symbol, self.link_atom_element)
             self.link_atoms[i]['scale_factor'] = g 
             # this is in nm
             self.link_atoms[i]['link_positions'] = (1-g) * self.positions[qm.index] + g*self.positions[mm.index]
 
             if self.boundary_treatment == 'RC' or self.boundary_treatment == 'RCD':
-                bonds = []
                 # find index of atoms bonded to mm atom
-                for bond in self.topology.bonds:
-                    if bond[0]== mm or bond[1] == mm:
-                        if bond[0] != qm and bond[1] != qm:
-                            if bond[0] != mm:
-                                bonds.append(bond[0].index)
-                            elif bond[1] != mm:
-                                bonds.append(bond[1].index)
+                indptr, neighbors, bond_ids = self.get_adjacency()
+                mm_neighbors = neighbors[indptr[mm.index]:indptr[mm.index + 1]]
+                bonds = mm_neighbors[mm_neighbors != qm.index].tolist()
 
                 self.link_atoms[i]['bonds_to_mm'] = bonds
                 self.link_atoms['all_outer_bonds'].append(bonds)
@@ -420,35 +844,134 @@ class QMMM(object):
         
         print('number of qm_atoms fed into make primary trajectory', len(qm_atoms))
 
-        self.find_boundary_bonds(qm_atoms)
-        traj = self.traj.atom_slice(qm_atoms)
+        layout = self.get_primary_subsys_layout(qm_atoms)
+        self.qmmm_boundary_bonds = layout['boundary_bonds']
+        self.link_atoms = {key : (dict(value) if isinstance(key, int) else value) for key, value in layout['link_atoms'].items()}
+
+        # this is in nm, in the precision of the positions
+        g = layout['scale_factors'][:, None]
+        dtype = self.positions.dtype
+        link_positions = (1-g).astype(dtype) * self.positions[layout['link_qm']] + g.astype(dtype) * self.positions[layout['link_mm']]
+        for i, position in enumerate(link_positions):
+            self.link_atoms[i]['link_positions'] = position
+
+        n_atoms = len(layout['atoms'])
+        xyz = np.empty((1, n_atoms + len(link_positions), 3), dtype=np.float32)
+        xyz[0, :n_atoms] = self.positions[layout['atoms']]
+        xyz[0, n_atoms:] = link_positions
+
+        traj = md.Trajectory(xyz, layout['topology'], 
+                             unitcell_lengths=self.traj.unitcell_lengths, 
+                             unitcell_angles=self.traj.unitcell_angles)
+
+        return traj, list(layout['link_indices'])
+
+    def get_primary_subsys_layout(self, qm_atoms):
+        '''
+        Gets the parts of the primary subsystem that only depend on the 
+        QM atoms: the boundary bonds, the link atoms, and the topology with 
+        link atoms added. These are saved for the last subsys_cache_size 
+        sets of QM atoms, so they are only made once for partitions that 
+        are seen again, and the topology is shared by the trajectories 
+        made from them, so it should not be modified.
+
+        Parameters
+        ----------
+        qm_atoms : list 
+            atom indicies corresponding to the atoms in
+            the primary subsystem
+
+        Returns
+        -------
+        dict
+            with the boundary bonds('boundary_bonds'), the link atoms('link_atoms') 
+            as made by :func:`~janus.qmmm.QMMM.prepare_link_atom`, the sorted QM atoms('atoms'),
+            the topology('topology'), the indices of the link atoms in the topology('link_indices'),
+            and the QM atoms('link_qm'), MM atoms('link_mm') and scale factors('scale_factors') 
+            of the link atoms
+        '''
+
+        atoms = np.unique(np.asarray(qm_atoms, dtype=int))
+        key = tuple(atoms.tolist())
+
+        if key in self.subsys_cache:
+            self.subsys_cache.move_to_end(key)
+            return self.subsys_cache[key]
+
+        self.find_boundary_bonds(atoms)
+        self.prepare_link_atom()
+
+        top = self.topology.subset(atoms)
+        links = [self.link_atoms[i] for i in range(len(self.qmmm_boundary_bonds))]
 
         link_indices = []
-        if self.qmmm_boundary_bonds:
-            self.prepare_link_atom()
+        for link in links:
+            link_element = md.element.Element.getBySymbol(link['link_atom'])
+            atom = top.atom(int(np.searchsorted(atoms, link['qm_atom'].index)))
+            link_atom = top.add_atom(name='H1', element=link_element, residue=atom.residue, serial='link')
+            top.add_bond(link_atom, atom)
+            link['link_atom_index'] = link_atom.index
+            link_indices.append(link_atom.index)
+
+        layout = {}
+        layout['boundary_bonds'] = self.qmmm_boundary_bonds
+        layout['link_atoms'] = self.link_atoms
+        layout['atoms'] = atoms
+        layout['topology'] = top
+        layout['link_indices'] = link_indices
+        layout['link_qm'] = np.array([link['qm_atom'].index for link in links], dtype=int)
+        layout['link_mm'] = np.array([link['mm_atom'].index for link in links], dtype=int)
+        layout['scale_factors'] = np.array([link['scale_factor'] for link in links], dtype=np.float64)
+
+        self.subsys_cache[key] = layout
+        if len(self.subsys_cache) > self.subsys_cache_size:
+            self.subsys_cache.popitem(last=False)
+
+        return layout
+
+    def get_primary_subsys_atoms(self, qm_atoms=None):
+        '''
+        Gets the indices in the entire system of the atoms in the
+        trajectory made by :func:`~janus.qmmm.QMMM.make_primary_subsys_trajectory`,
+        with each link atom given the index of the MM atom it replaces.
+        Needs to be called after make_primary_subsys_trajectory.
+
+        Parameters
+        ----------
+        qm_atoms : list 
+            atom indicies corresponding to the atoms in
+            the primary subsystem. Default is None and uses self.qm_atoms
+
+        Returns
+        -------
+        list
+            indices in the entire system
 
+        Examples
+        --------
+        >>> get_primary_subsys_atoms([0,1,2])
+        '''
+
+        if qm_atoms is None:
+            qm_atoms = self.qm_atoms
+
+        atoms = sorted(qm_atoms)
+        if self.qmmm_boundary_bonds:
             for i, link in self.link_atoms.items():
                 if isinstance(i, int):
-                
-                    link_element = md.element.Element.getBySymbol(link['link_atom'])
-
-                    for atom in traj.topology.atoms:
-                        if atom.serial == link['qm_atom'].serial:
-                            traj.topology.add_atom(name='H1', element=link_element, residue=atom.residue, serial='link')
-                            for atom2 in traj.topology.atoms:
-                                if atom2.serial == 'link':
-                                    traj.topology.add_bond(atom2, atom)
-                                    link['link_atom_index'] = atom2.index
-
-                    link_indices.append(link['link_atom_index'])
-                    traj.xyz = np.append(traj.xyz[0], [link['link_positions']], axis=0)
-        
-        return traj, link_indices
+                    atoms.append(link['mm_atom'].index)
+
+        return atoms
 
     def make_second_subsys_trajectory(self, qm_atoms=None):
         '''
         Creates a MDtraj trajectory object with just the 
-        secondary subsystem
+        secondary subsystem. The indices of its atoms, saved as self.mm_atoms, 
+        and its topology only depend on the QM atoms, so they are saved for 
+        the last subsys_cache_size sets of QM atoms and only the positions 
+        are taken from self.traj when a set of QM atoms is seen again. 
+        The topology is shared by the trajectories made from it, 
+        so it should not be modified.
 
         Parameters
         ----------
@@ -468,10 +991,27 @@ class QMMM(object):
 
         if qm_atoms is None:
             qm_atoms = self.qm_atoms
-    
-        self.mm_atoms = [i for i in range(self.traj.n_atoms) if i not in qm_atoms]
 
-        traj = self.traj.atom_slice(self.mm_atoms)
+        key = tuple(np.unique(np.asarray(list(qm_atoms), dtype=int)).tolist())
+
+        if key in self.second_subsys_cache:
+            self.second_subsys_cache.move_to_end(key)
+            layout = self.second_subsys_cache[key]
+        else:
+            mask = np.ones(self.traj.n_atoms, dtype=bool)
+            mask[list(key)] = False
+            indices = np.flatnonzero(mask)
+
+            layout = {'indices' : indices, 'atoms' : indices.tolist(), 'topology' : self.topology.subset(indices)}
+            self.second_subsys_cache[key] = layout
+            if len(self.second_subsys_cache) > self.subsys_cache_size:
+                self.second_subsys_cache.popitem(last=False)
+
+        self.mm_atoms = layout['atoms']
+
+        traj = md.Trajectory(self.positions[layout['indices']][None], layout['topology'], 
+                             unitcell_lengths=self.traj.unitcell_lengths, 
+                             unitcell_angles=self.traj.unitcell_angles)
 
         return traj
 
@@ -487,7 +1027,7 @@ class QMMM(object):
         
         Returns
         -------
-        dict
+        :class:`~janus.system.ForceBuffer`
             qmmm forces in au/bohr
 
         Examples
@@ -512,80 +1052,238 @@ class QMMM(object):
 
         Returns
         -------
-        list
-            charges and corresponding positions in angstroms as xyz coordinates
+        numpy array
+            (N,4) array of charges and corresponding positions in angstroms as xyz coordinates, 
+            None for mechanical embedding. If self.embedding_cutoff is given, 
+            the charges beyond the cutoff are compressed. On the steps given by 
+            self.embedding_error_interval, the error of the potential and field 
+            at the QM atoms is then saved as self.embedding_error
 
         """
-        charges = []
-        # in angstroms
-        es_pos = 10*system.entire_sys['positions']
-        charge = self.ll_wrapper.get_main_charges()
-
         if self.embedding_method == 'Mechanical':
             return None
 
-        elif self.boundary_treatment == 'link_atom':
-            for i, chrg in enumerate(charge):
-                # add every atom not in qm system 
-                if i not in system.qm_atoms:
-                    # save positions in angstroms
-                    charges.append([chrg, es_pos[i][0], es_pos[i][1], es_pos[i][2]])
-        
+        # charges and positions in angstroms of the entire system
+        es_pos, all_charges = self.get_charge_array(system)
+        charge = all_charges[:, 0]
+
+        # atoms whose own charges are used
+        mask = np.ones(len(all_charges), dtype=bool)
+        mask[np.asarray(system.qm_atoms, dtype=int)] = False
+        # index of the atom each charge is taken from
+        indices = np.zeros(0, dtype=int)
+        charges = np.zeros((0, 4))
+
+        if self.boundary_treatment == 'link_atom':
+            # add every atom not in qm system 
+            indices = np.flatnonzero(mask)
+            charges = all_charges[indices]
+
         # This is for the RC and RCD schemes
-        elif self.boundary_treatment == 'RC':
+        elif self.boundary_treatment == 'RC' or self.boundary_treatment == 'RCD':
 
-            for i, chrg in enumerate(charge):
-                # add every atom not in qm system or the M1 atom 
-                if i not in system.qm_atoms and i not in self.link_atoms['all_mm']:
-                        charges.append([chrg, es_pos[i][0], es_pos[i][1], es_pos[i][2]])
-            
+            m1 = np.asarray(self.link_atoms['all_mm'], dtype=int)
             bonds = self.link_atoms['all_outer_bonds']
+            n_bonds = np.array([len(b) for b in bonds], dtype=int)
 
-            for i, index in enumerate(self.link_atoms['all_mm']):
+            # the M2 atoms bonded to each M1 atom, and the M1 atom of each
+            m2 = np.array([bond for b in bonds for bond in b], dtype=int)
+            m2_m1 = np.repeat(m1, n_bonds)
+            link_id = np.repeat(np.arange(len(m1)), n_bonds)
 
-                # check to see that the M1 atom is attached to any M2 atoms
-                if bonds[i]:
-                    # get q0
-                    q0 = charge[index] / len(bonds[i])
+            # get q0
+            q0 = charge[m2_m1] / np.repeat(n_bonds, n_bonds)
+            # get positions in angstroms
+            positions = self.get_redistributed_positions(es_pos, m2, m2_m1)
 
-                    # get positions in angstroms
-                    positions = self.get_redistributed_positions(es_pos, bonds[i], index)
+            redistributed = np.zeros((len(m2), 4))
+            redistributed[:, 0] = q0
+            redistributed[:, 1:] = positions
 
-                    for pos in positions:
-                        charges.append([q0, pos[0], pos[1], pos[2]])
+            # leave out the M1 atoms 
+            mask[m1] = False
 
-        elif self.boundary_treatment == 'RCD':
+            if self.boundary_treatment == 'RC':
+                indices = np.concatenate([np.flatnonzero(mask), m2])
+                charges = np.concatenate([all_charges[mask], redistributed])
 
-            bonds = self.link_atoms['all_outer_bonds']
-            m1_m2 = []
+            else:
+                redistributed[:, 0] *= 2
+                # the M2 atoms have their charges reduced by q0
+                m2_charges = all_charges[m2]
+                m2_charges[:, 0] -= q0
 
-            for i, index in enumerate(self.link_atoms['all_mm']):
+                # for each M1 atom, the redistributed charges and then its M2 atoms
+                order = np.argsort(np.concatenate([2*link_id, 2*link_id + 1]), kind='stable')
+                mask[m2] = False
 
-                m1_m2.append(index)
-                # get q0
+                indices = np.concatenate([np.concatenate([m2, m2])[order], np.flatnonzero(mask)])
+                charges = np.concatenate([np.concatenate([redistributed, m2_charges])[order], all_charges[mask]])
 
-                if bonds[i]:
+        charges = charges.reshape(-1, 4)
 
-                    q0 = charge[index] / len(bonds[i])
-                    q0_RCD = q0 * 2
+        if self.embedding_cutoff is not None:
+            full_charges = charges
+            charges = self.truncate_external_charges(system, full_charges, np.array(indices, dtype=int))
 
-                    # get positions in angstroms
-                    positions = self.get_redistributed_positions(es_pos, bonds[i], index)
+            if (self.embedding_error_interval != 0 and system.run_ID % self.embedding_error_interval == 0):
+                self.embedding_error = self.get_embedding_error(system, full_charges, charges)
+                print('Embedding error with {} of {} charges: potential rms {:.2e}, field rms {:.2e}'.format(
+                      self.embedding_error['n_charges'], self.embedding_error['n_full'], 
+                      self.embedding_error['potential_rms'], self.embedding_error['field_rms']))
 
-                    for pos in positions:
-                        charges.append([q0_RCD, pos[0], pos[1], pos[2]])
+        return charges
 
-                    for bond in bonds[i]:
-                        m1_m2.append(bond)
-                        charges.append([charge[bond] - q0, es_pos[bond][0], es_pos[bond][1], es_pos[bond][2]])
+    def get_atom_residues(self):
+        """
+        Gets the index of the residue of each atom in the entire system,
+        which is only recomputed if the topology changes
 
-            for i, chrg in enumerate(charge):
-                # add every atom not in qm system or the M1 atom 
-                if i not in system.qm_atoms and i not in m1_m2:
-                        charges.append([chrg, es_pos[i][0], es_pos[i][1], es_pos[i][2]])
+        Returns
+        -------
+        numpy array
+            residue indices of the atoms
+        """
 
-                
-        return charges
+        if (self.atom_residues is None or self.atom_residues_topology is not self.topology):
+            self.atom_residues = np.array([atom.residue.index for atom in self.topology.atoms], dtype=int)
+            self.atom_residues_topology = self.topology
+
+        return self.atom_residues
+
+    def truncate_external_charges(self, system, charges, atoms, separation=1.0):
+        """
+        Truncates the MM point charges of electrostatic embedding at self.embedding_cutoff.
+        Residues are treated as a whole, with their distance given by the 
+        closest charge to any QM atom. The charges of residues within 
+        self.embedding_cutoff - self.embedding_switch_width are kept explicitly, 
+        while each residue beyond self.embedding_cutoff is compressed into 
+        its total charge and dipole about its center, represented by two point charges 
+        separated by separation along the dipole, or one if the dipole is zero.
+        Residues beyond self.embedding_outer_cutoff, if given, are left out, 
+        so the number of point charges is bounded by the number of residues 
+        within self.embedding_outer_cutoff of the QM atoms. In between, the explicit and compressed charges are scaled by 
+        the quintic switching function
+
+        .. math::
+            S(x) = 1 - 10x^3 + 15x^4 - 6x^5
+
+        and 1 - S(x), so the field changes smoothly as residues cross the cutoff
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system with the positions of the entire system
+        charges : numpy array
+            (N,4) array of charges and corresponding positions in angstroms
+        atoms : numpy array
+            the index of the atom each charge is taken from
+        separation : float
+            distance in angstroms between the two point charges of a compressed residue,
+            default is 1.0
+
+        Returns
+        -------
+        numpy array
+            (N,4) array of the explicit and compressed charges and positions in angstroms
+
+        """
+
+        if len(charges) == 0:
+            return charges
+
+        qm_pos = 10*system.entire_sys['positions'][system.qm_atoms]
+        pos, q = charges[:, 1:], charges[:, 0]
+
+        # distance of each charge to the closest QM atom
+        dist2 = np.sum(pos**2, axis=1)[:, None] + np.sum(qm_pos**2, axis=1)[None, :] - 2*pos.dot(qm_pos.T)
+        dist = np.sqrt(np.maximum(np.min(dist2, axis=1), 0.0))
+
+        residues, inverse, counts = np.unique(self.get_atom_residues()[atoms], return_inverse=True, return_counts=True)
+        res_dist = np.full(len(residues), np.inf)
+        np.minimum.at(res_dist, inverse, dist)
+
+        # switching function of each residue
+        x = np.clip((res_dist - (self.embedding_cutoff - self.embedding_switch_width)) / self.embedding_switch_width, 0.0, 1.0)
+        switch = 1 - 10*x**3 + 15*x**4 - 6*x**5
+        switch[res_dist <= self.embedding_cutoff - self.embedding_switch_width] = 1.0
+        switch[res_dist >= self.embedding_cutoff] = 0.0
+
+        # explicit charges
+        weight = switch[inverse]
+        explicit = charges[weight > 0].copy()
+        explicit[:, 0] *= weight[weight > 0]
+
+        # total charge and dipole of the compressed part of each residue 
+        q_far = q * (1 - weight)
+        far = np.bincount(inverse, weights=1 - weight) > 0
+        center = np.stack([np.bincount(inverse, weights=pos[:, k]) for k in range(3)], axis=1) / counts[:, None]
+        Q = np.bincount(inverse, weights=q_far)
+        p = np.stack([np.bincount(inverse, weights=q_far*(pos[:, k] - center[inverse, k])) for k in range(3)], axis=1)
+        p_norm = np.linalg.norm(p, axis=1)
+
+        if self.embedding_outer_cutoff is not None:
+            far &= (res_dist < self.embedding_outer_cutoff)
+
+        monopole = far & (p_norm < 1e-8) & (np.abs(Q) > 1e-8)
+        dipole = far & (p_norm >= 1e-8)
+
+        sites = [explicit, np.column_stack([Q[monopole], center[monopole]])]
+        direction = p[dipole] / p_norm[dipole, None] * separation / 2
+        for sign in [1, -1]:
+            q_site = Q[dipole]/2 + sign * p_norm[dipole]/separation
+            sites.append(np.column_stack([q_site, center[dipole] + sign * direction]))
+
+        return np.concatenate(sites)
+
+    def get_embedding_error(self, system, full_charges, charges):
+        """
+        Gets the error of the electrostatic potential and field at the QM atoms
+        from a set of point charges compared to that of the full set of point charges
+
+        Parameters
+        ----------
+        system : :class:`~janus.system.System`
+            The system with the positions of the entire system
+        full_charges : numpy array
+            (N,4) array of all the charges and corresponding positions in angstroms
+        charges : numpy array
+            (N,4) array of the charges and corresponding positions in angstroms to compare
+
+        Returns
+        -------
+        dict
+            the number of full('n_full') and compared('n_charges') charges, and the root mean square 
+            and maximum errors of the potential('potential_rms', 'potential_max') in au 
+            and of the field('field_rms', 'field_max') in au at the QM atoms
+
+        """
+
+        qm_pos = 10*system.entire_sys['positions'][system.qm_atoms]
+        ang_to_bohr = self.ll_wrapper.nm_to_bohr / 10
+
+        def potential_and_field(chrgs):
+            r = (qm_pos[:, None, :] - chrgs[None, :, 1:]) * ang_to_bohr
+            d = np.linalg.norm(r, axis=2)
+            potential = np.sum(chrgs[None, :, 0] / d, axis=1)
+            field = np.sum(chrgs[None, :, 0, None] * r / d[:, :, None]**3, axis=1)
+            return potential, field
+
+        potential, field = potential_and_field(charges)
+        full_potential, full_field = potential_and_field(full_charges)
+
+        dV = np.abs(potential - full_potential)
+        dE = np.linalg.norm(field - full_field, axis=1)
+
+        error = {}
+        error['n_full'] = len(full_charges)
+        error['n_charges'] = len(charges)
+        error['potential_rms'] = np.sqrt(np.mean(dV**2))
+        error['potential_max'] = np.max(dV)
+        error['field_rms'] = np.sqrt(np.mean(dE**2))
+        error['field_max'] = np.max(dE)
+
+        return error
 
     def get_redistributed_positions(self, positions, bonds, mm):
         """
@@ -593,26 +1291,24 @@ class QMMM(object):
 
         Parameters
         ----------
-        positions : list 
+        positions : numpy array 
+            positions of the entire system
         bonds : list 
             indices of all atoms (in secondary subsystem) bonded to M1  
-        mm : int 
-            the index of M1
+        mm : int or numpy array
+            the index of M1, or the index of the M1 atom bonded to each atom in bonds
 
         Returns
         -------
-        list
+        numpy array
             positions for the redistributed charges
 
         """
         
-        pos = []
-    
-        for bond in bonds:
-            new_pos = ((positions[bond] + positions[mm]) / 2)
-            pos.append(new_pos)
-        
-        return pos
+        positions = np.asarray(positions)
+        bonds = np.asarray(bonds, dtype=int)
+
+        return (positions[bonds] + positions[mm]) / 2
 
             
     def convert_input(self, fil, form):
@@ -105,3 +105,196 @@ class Buffer(object):
         self.d_s_i = None
 
 
+
+class ForceBuffer(object):
+    """
+    A class that stores forces on a subset of the atoms as a dense array,
+    the format in which QM/MM forces are passed from 
+    :func:`~janus.qmmm.QMMM.compute_gradients` through the adaptive QM/MM methods
+    to :func:`~janus.mm_wrapper.OpenMMWrapper.update_forces`.
+    The indices of the atoms are kept sorted, with the forces in the same order,
+    so forces are scaled and combined with a few array operations.
+
+    ForceBuffer can also be used like the dictionary (atom index : forces)
+    in which forces used to be stored, e.g. forces[i], i in forces, and forces.items().
+
+    Parameters
+    ----------
+    indices : list
+        indices of the atoms with forces, each given once. Default is None, with no atoms
+    forces : numpy array
+        (N,3) array of forces on the atoms, in the order of indices, in au/bohr
+    """
+
+    def __init__(self, indices=None, forces=None):
+
+        indices = np.zeros(0, dtype=int) if indices is None else np.asarray(indices, dtype=int).reshape(-1)
+        order = np.argsort(indices, kind='stable')
+
+        self.indices = indices[order]
+        self.forces = np.zeros((len(indices), 3)) if forces is None else np.array(forces, dtype=np.float64).reshape(-1, 3)[order]
+
+        if np.any(self.indices[1:] == self.indices[:-1]):
+            raise ValueError('ForceBuffer indices need to be unique')
+
+    def from_forces(forces):
+        """
+        Gets the forces as a ForceBuffer
+
+        Parameters
+        ----------
+        forces : ForceBuffer or dict
+            ForceBuffer, which is returned as is, 
+            or dictionary of forces(atom index : forces)
+
+        Returns
+        -------
+        ForceBuffer
+        """
+
+        if isinstance(forces, ForceBuffer):
+            return forces
+
+        indices = list(forces.keys())
+        values = np.array([np.asarray(forces[i], dtype=np.float64).reshape(3) for i in indices]).reshape(-1, 3)
+
+        return ForceBuffer(indices, values)
+
+    def copy(self):
+        """
+        Returns
+        -------
+        ForceBuffer
+            a copy that does not share arrays with this ForceBuffer
+        """
+
+        return ForceBuffer(self.indices.copy(), self.forces.copy())
+
+    def scaled(self, scale):
+        """
+        Parameters
+        ----------
+        scale : float
+            factor by which to multiply the forces
+
+        Returns
+        -------
+        ForceBuffer
+            a copy with the forces multiplied by scale
+        """
+
+        return ForceBuffer(self.indices.copy(), self.forces * scale)
+
+    def get_rows(self, indices):
+        """
+        Gets the rows of atoms in self.forces, adding zero forces
+        for the atoms that do not have forces yet
+
+        Parameters
+        ----------
+        indices : numpy array
+            indices of the atoms
+
+        Returns
+        -------
+        numpy array
+            the rows in self.forces
+        """
+
+        indices = np.asarray(indices, dtype=int).reshape(-1)
+        new = np.setdiff1d(indices, self.indices)
+
+        if len(new) > 0:
+            all_indices = np.union1d(self.indices, new)
+            forces = np.zeros((len(all_indices), 3))
+            forces[np.searchsorted(all_indices, self.indices)] = self.forces
+            self.indices, self.forces = all_indices, forces
+
+        return np.searchsorted(self.indices, indices)
+
+    def add_forces(self, indices, forces, scale=1.0):
+        """
+        Adds forces to atoms. Forces given more than once for an atom are summed
+
+        Parameters
+        ----------
+        indices : list
+            indices of the atoms
+        forces : numpy array
+            (N,3) array of forces on the atoms, in au/bohr
+        scale : float
+            factor by which to multiply forces before adding them. Default is 1.0
+        """
+
+        rows = self.get_rows(indices)
+        forces = np.asarray(forces, dtype=np.float64).reshape(-1, 3)
+
+        if len(np.unique(rows)) == len(rows):
+            self.forces[rows] += scale * forces
+        else:
+            np.add.at(self.forces, rows, scale * forces)
+
+    def set_forces(self, indices, forces):
+        """
+        Sets the forces on atoms, replacing any forces they had.
+        If an atom is given more than once, the last forces given are used
+
+        Parameters
+        ----------
+        indices : list
+            indices of the atoms
+        forces : numpy array
+            (N,3) array of forces on the atoms, in au/bohr
+        """
+
+        indices = np.asarray(indices, dtype=int).reshape(-1)
+        forces = np.asarray(forces, dtype=np.float64).reshape(-1, 3)
+
+        # the last time each atom is given
+        unique, last = np.unique(indices[::-1], return_index=True)
+        last = len(indices) - 1 - last
+
+        rows = self.get_rows(unique)
+        self.forces[rows] = forces[last]
+
+    def add(self, other, scale=1.0):
+        """
+        Adds the forces of another ForceBuffer 
+
+        Parameters
+        ----------
+        other : ForceBuffer or dict
+            forces to add
+        scale : float
+            factor by which to multiply the forces of other before adding them. Default is 1.0
+        """
+
+        other = ForceBuffer.from_forces(other)
+        self.add_forces(other.indices, other.forces, scale=scale)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __contains__(self, index):
+        i = np.searchsorted(self.indices, index)
+        return bool(i < len(self.indices) and self.indices[i] == index)
+
+    def __getitem__(self, index):
+        if index not in self:
+            raise KeyError(index)
+        return self.forces[np.searchsorted(self.indices, index)]
+
+    def __setitem__(self, index, force):
+        self.set_forces([index], force)
+
+    def __iter__(self):
+        return iter(self.indices.tolist())
+
+    def keys(self):
+        return self.indices.tolist()
+
+    def values(self):
+        return list(self.forces)
+
+    def items(self):
+        return zip(self.indices.tolist(), self.forces)
@@ -0,0 +1,137 @@
+"""
+Testing for analytic_wrapper.py module
+"""
+from janus.qm_wrapper import AnalyticWrapper
+from janus import initializer, qmmm
+from janus.mm_wrapper import OpenMMWrapper
+import mdtraj as md
+import numpy as np
+import os
+
+water = os.path.join(str('tests/files/test_openmm/water.pdb'))
+traj = md.load(water)
+qm_traj = traj.atom_slice([0,1,2,3,4,5])
+
+qm_mol = """O     0.123   3.593   5.841 
+ H    -0.022   2.679   5.599 
+ H     0.059   3.601   6.796 
+ O     0.017   6.369   7.293 
+ H    -0.561   5.928   6.669 
+ H     0.695   6.771   6.749 
+ """
+
+charges = np.array([[-0.834, 0.115,  0.313, 6.148],
+                    [ 0.417, 0.613,  0.922, 5.616],
+                    [ 0.417, 0.215, -0.559, 5.753]])
+
+def finite_difference_gradient(wrapper, xyz, h=1e-5):
+
+    gradient = np.zeros_like(xyz)
+    for i in range(xyz.shape[0]):
+        for k in range(3):
+            plus, minus = xyz.copy(), xyz.copy()
+            plus[i,k] += h
+            minus[i,k] -= h
+            gradient[i,k] = (wrapper.compute_energy_and_gradient(plus)[0] - wrapper.compute_energy_and_gradient(minus)[0]) / (2*h)
+
+    # from per angstrom to per bohr
+    return gradient / AnalyticWrapper.ang_to_bohr
+
+def test_get_energy_and_gradient():
+
+    qm = AnalyticWrapper()
+    info1 = qm.get_energy_and_gradient(traj=qm_traj)
+    info2 = qm.get_energy_and_gradient(geometry=qm_mol)
+    info3 = qm.get_energy_and_gradient(traj=qm_traj, charges=charges)
+
+    assert np.allclose(info1['energy'], info2['energy'], atol=1e-4)
+    assert info1['gradients'].shape == (6, 3)
+    assert abs(info1['energy'] - info3['energy']) > 1e-6
+    assert np.allclose(info3['gradients'], finite_difference_gradient(qm, qm.qm_xyz), atol=1e-6)
+
+def test_optimize_geometry():
+
+    qm = AnalyticWrapper()
+    info = qm.get_energy_and_gradient(traj=qm_traj, charges=charges)
+    opt = qm.get_energy_and_gradient(traj=qm_traj, minimize=True)
+
+    assert opt['energy'] < info['energy']
+    assert np.allclose(opt['gradients'], 0.0, atol=1e-4)
+
+def test_get_wrapper_param():
+
+    qm = AnalyticWrapper(well_depth=0.2, basis='STO-3G')
+    copy = AnalyticWrapper(**qm.get_wrapper_param())
+
+    assert copy.well_depth == 0.2
+    assert copy.qm_param['basis'] == 'STO-3G'
+
+def test_initializer():
+
+    param = {"system" : {"system_info" : water, "hl_program" : "Analytic"},
+             "qmmm" : {"qm_atoms" : [0,1,2], "embedding_method" : "Electrostatic"}}
+
+    init = initializer.Initializer(param, as_file=False)
+    mm, qmmm = init.initialize_wrappers()
+    mm.initialize(qmmm.embedding_method)
+    qmmm.run_qmmm(mm.get_main_info(), 'OpenMM')
+
+    assert init.hl_wrapper is AnalyticWrapper
+    assert qmmm.hl_wrapper.class_type == 'Analytic'
+    assert len(qmmm.get_forces()) == 9
+
+def test_aqmmm_simulation_cache():
+
+    energies = []
+    for cache_size in [10, 0]:
+        mm = OpenMMWrapper(sys_info=water, **{'md_ensemble':'NVT', 'return_info':[], 'simulation_cache_size':cache_size})
+        mm.initialize('Mechanical')
+        pap = qmmm.PAP(hl_wrapper=AnalyticWrapper(), ll_wrapper=mm, sys_info=water, 
+                       qmmm_param={'embedding_method' : 'Mechanical'}, Rmin=2.6, Rmax=3.4)
+        pap.run_qmmm(mm.get_main_info(), 'OpenMM')
+
+        systems = pap.systems[0]
+        energies.append([systems['qm'].qmmm_energy] + [systems[i].qmmm_energy for i in range(len(pap.partitions))])
+        energies[-1].append(systems['qmmm_energy'])
+
+    # partitions with more than one molecule have no link atoms
+    assert len(energies[0]) == 5
+    assert np.allclose(energies[0], energies[1], rtol=0, atol=1e-8)
+
+def test_aqmmm_close():
+
+    mm = OpenMMWrapper(sys_info=water, **{'md_ensemble':'NVT', 'return_info':[]})
+    mm.initialize('Mechanical')
+    energies = []
+    for workers in [0, 2]:
+        with qmmm.PAP(hl_wrapper=AnalyticWrapper(), ll_wrapper=mm, sys_info=water, 
+                      qmmm_param={'embedding_method' : 'Mechanical', 'qm_workers' : workers}, Rmin=2.6, Rmax=3.4) as pap:
+            pap.run_qmmm(mm.get_main_info(), 'OpenMM')
+            energies.append(pap.systems[0]['qmmm_energy'])
+            executor = pap.qm_executor
+
+        assert pap.qm_executor is None
+
+    assert np.allclose(energies[0], energies[1])
+    assert not os.path.isdir(executor.scratch_root)
+
+def test_qmmm_no_topology_conversion(monkeypatch):
+
+    mm = OpenMMWrapper(sys_info=water, **{'md_ensemble':'NVT', 'return_info':[]})
+    mm.initialize('Electrostatic')
+    elec = qmmm.QMMM(AnalyticWrapper(), mm, sys_info=water, qm_atoms=[0,1,2], embedding_method='Electrostatic')
+    elec.run_qmmm(mm.get_main_info(), 'OpenMM')
+
+    # count the conversions of topologies to OpenMM in later steps
+    conversions = []
+    to_openmm = md.Topology.to_openmm
+    def counted_to_openmm(topology, *args, **kwargs):
+        conversions.append(topology)
+        return to_openmm(topology, *args, **kwargs)
+    monkeypatch.setattr(md.Topology, 'to_openmm', counted_to_openmm)
+
+    mm.take_updated_step(elec.get_forces())
+    elec.run_qmmm(mm.get_main_info(), 'OpenMM')
+
+    assert conversions == []
+    assert len(elec.get_forces()) == 9
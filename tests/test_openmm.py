@@ -3,8 +3,11 @@ Testing for the openmm_wrapper module
 """
 import pytest
 from janus.mm_wrapper import OpenMMWrapper
+from janus.qmmm import QMMM
 import simtk.unit as OM_unit
+import simtk.openmm as OM
 import numpy as np
+import mdtraj as md
 import os
 
 #ala_water_pdb_file = os.path.join(str('tests/files/test_openmm/ala_water.pdb'))
@@ -26,6 +29,41 @@ def test_create_new_residue_template():
 
     assert wrapper_ala.forcefield._templates['Modified_ALA'].name == 'Modified_ALA' 
 
+def test_get_residue_templates(tmpdir):
+    template_file = os.path.join(str(tmpdir), 'templates.xml')
+    wrapper_templates = OpenMMWrapper(sys_info=ala_pdb_file, **{'md_ensemble':'NVT', 'residue_template_file':template_file})
+
+    mod = wrapper_templates.create_modeller(keep_atoms=False, atoms=[0,1,2,3])
+    templates1 = wrapper_templates.get_residue_templates(mod.topology)
+    num_templates = len(wrapper_templates.forcefield._templates)
+    templates2 = wrapper_templates.get_residue_templates(mod.topology)
+
+    assert list(templates1.values()) == ['Modified_ALA']
+    assert list(templates2.values()) == ['Modified_ALA']
+    assert len(wrapper_templates.forcefield._templates) == num_templates
+    assert len(wrapper_templates.generated_templates) == 1
+
+    wrapper_loaded = OpenMMWrapper(sys_info=ala_pdb_file, **{'md_ensemble':'NVT', 'residue_template_file':template_file})
+    assert 'Modified_ALA' in wrapper_loaded.forcefield._templates
+    assert wrapper_loaded.forcefield.getUnmatchedResidues(mod.topology) == []
+
+def test_system_snapshot(tmpdir):
+    cache_file = os.path.join(str(tmpdir), 'system.pkl')
+    wrapper_1 = OpenMMWrapper(sys_info=water_pdb_file, **{'md_ensemble':'NVT', 'system_cache_file':cache_file})
+    wrapper_2 = OpenMMWrapper(sys_info=water_pdb_file, **{'md_ensemble':'NVT', 'system_cache_file':cache_file})
+    wrapper_3 = OpenMMWrapper(sys_info=water_pdb_file, nonbondedCutoff=0.9, **{'md_ensemble':'NVT', 'system_cache_file':cache_file})
+
+    sys_1 = wrapper_1.create_openmm_system(wrapper_1.topology)
+    sys_2 = wrapper_2.load_system_snapshot()
+    sys_3 = wrapper_2.create_openmm_system(wrapper_2.topology, initialize=True)
+
+    assert os.path.isfile(cache_file)
+    assert sys_2.getNumParticles() == sys_1.getNumParticles()
+    assert sys_2.getNumForces() == sys_1.getNumForces()
+    assert sys_3.getNumForces() == sys_1.getNumForces() + 1
+    assert wrapper_3.get_input_hash() != wrapper_1.get_input_hash()
+    assert wrapper_3.load_system_snapshot() is None
+
 def test_set_charge_zero():
 
     sys1 = wrapper.create_openmm_system(wrapper.pdb.topology)
@@ -58,6 +96,58 @@ def test_create_openmm_system():
     assert sys_2.getNumForces() == 6
     assert sys_3.getNumForces() == 2
 
+def test_create_openmm_subsystem():
+    atoms = [3,4,5,6,7,8]
+    mod = wrapper.create_modeller(keep_atoms=True, atoms=atoms)
+
+    sys_1 = wrapper.create_openmm_system(mod.topology)
+    sys_2 = wrapper.create_openmm_subsystem(mod.topology, atoms)
+    sys_3 = wrapper.create_openmm_subsystem(mod.topology, atoms, include_coulomb='only')
+
+    sim_1 = wrapper.create_openmm_simulation(sys_1, mod.topology, mod.positions, wrapper.integrator)
+    sim_2 = wrapper.create_openmm_simulation(sys_2, mod.topology, mod.positions, wrapper.integrator)
+    state1 = OpenMMWrapper.get_state_info(sim_1)
+    state2 = OpenMMWrapper.get_state_info(sim_2)
+
+    assert sys_2.getNumParticles() == 6
+    assert sys_2.getNumForces() == sys_1.getNumForces()
+    assert sys_3.getNumForces() == 2
+    assert np.allclose(state1['potential'], state2['potential'])
+    assert np.allclose(state1['gradients'], state2['gradients'])
+
+def test_create_openmm_subsystem_link_atoms():
+    wrapper_link = OpenMMWrapper(sys_info=ala_pdb_file, **{'md_ensemble':'NVT', 'return_info':[]})
+    ala_qmmm = QMMM(None, wrapper_link, sys_info=ala_pdb_file)
+    traj, link_atoms = ala_qmmm.make_primary_subsys_trajectory(qm_atoms=[i for i in range(12)])
+    atoms = ala_qmmm.get_primary_subsys_atoms(qm_atoms=[i for i in range(12)])
+    topology, positions = wrapper_link.convert_trajectory(traj)
+
+    sys_1 = wrapper_link.create_openmm_system(topology, include_coulomb='no_link', link_atoms=link_atoms)
+    sys_2 = wrapper_link.create_openmm_subsystem(topology, atoms, include_coulomb='no_link', link_atoms=link_atoms)
+
+    sim_1 = wrapper_link.create_openmm_simulation(sys_1, topology, positions, wrapper_link.integrator)
+    sim_2 = wrapper_link.create_openmm_simulation(sys_2, topology, positions, wrapper_link.integrator)
+    state1 = OpenMMWrapper.get_state_info(sim_1)
+    state2 = OpenMMWrapper.get_state_info(sim_2)
+
+    assert len(link_atoms) > 0
+    assert np.allclose(state1['potential'], state2['potential'])
+    assert np.allclose(state1['gradients'], state2['gradients'])
+
+def test_create_openmm_simulation_platform():
+    wrapper_platform = OpenMMWrapper(sys_info=water_pdb_file, **{'md_ensemble':'NVT', 'return_info':[], 'platform':'CPU',
+                                                                 'platform_properties':{'Threads' : 1},
+                                                                 'subsystem_platform_properties':{'Threads' : 2}})
+    openmm_sys = wrapper_platform.create_openmm_system(wrapper_platform.topology)
+    sim_1 = wrapper_platform.create_openmm_simulation(openmm_sys, wrapper_platform.topology, wrapper_platform.positions, 'Langevin', main=True)
+    openmm_sys = wrapper_platform.create_openmm_system(wrapper_platform.topology)
+    sim_2 = wrapper_platform.create_openmm_simulation(openmm_sys, wrapper_platform.topology, wrapper_platform.positions, 'Langevin')
+
+    platform = sim_1.context.getPlatform()
+    assert platform.getName() == 'CPU'
+    assert platform.getPropertyValue(sim_1.context, 'Threads') == '1'
+    assert platform.getPropertyValue(sim_2.context, 'Threads') == '2'
+
 def test_compute_info():
     #print(wrapper.md_ensemble)
     #print(wrapper.integrator)
@@ -69,6 +159,76 @@ def test_compute_info():
     assert np.allclose(state1['kinetic'] + state1['potential'],-0.010557407627282312)
     assert np.allclose(state2['kinetic'] + state2['potential'],-0.02892,rtol=1e-05,atol=1e-05)
 
+def test_compute_info_saved_simulation():
+    atoms = [i for i in range(9)]
+    key = (tuple(atoms), None)
+
+    state1 = wrapper.compute_info(wrapper.pdb.topology, wrapper.pdb.positions)
+    state2 = wrapper.compute_info(wrapper.pdb.topology, wrapper.pdb.positions, atoms=atoms)
+    simulation = wrapper.simulations[key]
+    state3 = wrapper.compute_info(wrapper.pdb.topology, wrapper.pdb.positions, atoms=atoms)
+
+    assert len(wrapper.simulations) == 1
+    assert wrapper.simulations[key] is simulation
+    assert np.allclose(state1['potential'], state2['potential'])
+    assert np.allclose(state2['potential'], state3['potential'])
+    assert np.allclose(state2['gradients'], state3['gradients'])
+
+def test_get_energy_and_gradient_saved_simulation(monkeypatch):
+    wrapper_saved = OpenMMWrapper(sys_info=water_pdb_file, **{'md_ensemble':'NVT', 'return_info':[]})
+    traj = md.load(water_pdb_file)
+    atoms = list(range(traj.n_atoms))
+
+    # count the conversions of the topology to OpenMM
+    conversions = []
+    to_openmm = md.Topology.to_openmm
+    def counted_to_openmm(topology, *args, **kwargs):
+        conversions.append(topology)
+        return to_openmm(topology, *args, **kwargs)
+    monkeypatch.setattr(md.Topology, 'to_openmm', counted_to_openmm)
+
+    state1 = wrapper_saved.get_energy_and_gradient(traj, atoms=atoms)
+    traj.xyz[0, 0] += 0.01
+    state2 = wrapper_saved.get_energy_and_gradient(traj, atoms=atoms)
+    state3 = wrapper.compute_info(traj.topology.to_openmm(), traj.openmm_positions(0))
+
+    assert len(conversions) == 2
+    assert not np.allclose(state1['potential'], state2['potential'])
+    assert np.allclose(state2['potential'], state3['potential'])
+    assert np.allclose(state2['gradients'], state3['gradients'], atol=1e-06)
+
+def test_coulomb_variants():
+    atoms = [i for i in range(9)]
+    wrapper_variants = OpenMMWrapper(sys_info=water_pdb_file, **{'md_ensemble':'NVT', 'return_info':[]})
+
+    variants = [('all', None), ('none', None), ('only', None), ('no_link', []), ('no_link', [0])]
+    for include_coulomb, link_atoms in variants:
+        state1 = wrapper_variants.compute_info(wrapper.pdb.topology, wrapper.pdb.positions, include_coulomb=include_coulomb, link_atoms=link_atoms)
+        state2 = wrapper_variants.compute_info(wrapper.pdb.topology, wrapper.pdb.positions, include_coulomb=include_coulomb, link_atoms=link_atoms, atoms=atoms)
+
+        assert np.allclose(state1['potential'], state2['potential'])
+        assert np.allclose(state1['gradients'], state2['gradients'])
+
+    assert len(wrapper_variants.simulations) == 2
+
+def test_simulation_cache():
+    wrapper_cache = OpenMMWrapper(sys_info=water_pdb_file, **{'md_ensemble':'NVT', 'return_info':[], 'simulation_cache_size':2})
+
+    mod_1 = wrapper_cache.create_modeller(keep_atoms=True, atoms=[0,1,2])
+    mod_2 = wrapper_cache.create_modeller(keep_atoms=True, atoms=[3,4,5])
+    mod_3 = wrapper_cache.create_modeller(keep_atoms=True, atoms=[6,7,8])
+
+    state1 = wrapper_cache.compute_info(mod_1.topology, mod_1.positions, atoms=[0,1,2])
+    wrapper_cache.compute_info(mod_2.topology, mod_2.positions, atoms=[3,4,5])
+    state2 = wrapper_cache.compute_info(mod_1.topology, mod_1.positions, atoms=[0,1,2])
+    wrapper_cache.compute_info(mod_3.topology, mod_3.positions, atoms=[6,7,8])
+    info = wrapper_cache.get_simulation_cache_info()
+
+    assert info == {'hits' : 1, 'misses' : 3, 'evictions' : 1, 'size' : 2, 'max_size' : 2}
+    assert ((0,1,2), None) in wrapper_cache.simulations
+    assert ((3,4,5), None) not in wrapper_cache.simulations
+    assert np.allclose(state1['potential'], state2['potential'])
+
 def test_initialize():
     wrapper.initialize('Mechanical')
     wrapper_ala.initialize('Electrostatic')
@@ -99,6 +259,59 @@ def test_take_updated_step():
     assert np.allclose(energy1, -0.0105, atol=1e-04)
     assert np.allclose(energy2, -0.009, atol=1e-03)
 
+def test_update_forces():
+    force1 = {0 : np.array([0.0001, 0.0, 0.0]), 1 : np.array([0.0, 0.0001, 0.0])}
+    force2 = {1 : np.array([0.0, 0.0, 0.0001])}
+
+    wrapper.update_forces(force1, wrapper.qmmm_force, wrapper.main_simulation)
+    wrapper.update_forces(force2, wrapper.qmmm_force, wrapper.main_simulation)
+    state = OpenMMWrapper.get_state_info(wrapper.main_simulation, energy=False, positions=False, groups_included={wrapper.qmmm_force_group})
+
+    assert wrapper.qmmm_force.getNumBonds() == 2
+    assert np.allclose(force1[0], [0.0001, 0.0, 0.0])
+    assert np.allclose(state['forces'][0], [0.0, 0.0, 0.0])
+    assert np.allclose(state['forces'][1], force2[1] * OpenMMWrapper.au_bohr_to_kjmol_nm)
+    assert np.allclose(state['forces'][2], [0.0, 0.0, 0.0])
+
+def test_update_forces_no_reinitialize(monkeypatch):
+    wrapper_forces = OpenMMWrapper(sys_info=water_pdb_file, **{'md_ensemble':'NVT', 'return_info':[]})
+    wrapper_forces.initialize('Mechanical')
+
+    reinitialized = []
+    reinitialize = OM.Context.reinitialize
+    def counted_reinitialize(context, *args, **kwargs):
+        reinitialized.append(context)
+        return reinitialize(context, *args, **kwargs)
+    monkeypatch.setattr(OM.Context, 'reinitialize', counted_reinitialize)
+
+    # two buffers with different atoms, alternating every step
+    force1 = {0 : np.array([0.0001, 0.0, 0.0]), 3 : np.array([0.0, 0.0001, 0.0])}
+    force2 = {3 : np.array([0.0, 0.0, 0.0001]), 6 : np.array([0.0001, 0.0001, 0.0])}
+    for step in range(6):
+        forces = force1 if step % 2 == 0 else force2
+        wrapper_forces.update_forces(forces, wrapper_forces.qmmm_force, wrapper_forces.main_simulation)
+        state = OpenMMWrapper.get_state_info(wrapper_forces.main_simulation, energy=False, positions=False, 
+                                             groups_included={wrapper_forces.qmmm_force_group})
+
+        for i in range(9):
+            expected = forces[i] * OpenMMWrapper.au_bohr_to_kjmol_nm if i in forces else np.zeros(3)
+            assert np.allclose(state['forces'][i], expected)
+
+    # only the first time each buffer is seen
+    assert len(reinitialized) == 2
+    assert wrapper_forces.qmmm_force.getNumBonds() == 3
+
+def test_get_main_info_mm():
+    info = wrapper.get_main_info(include_mm=True)
+    state = wrapper.compute_info(wrapper.pdb.topology, info['positions'])
+
+    # only computed if asked for
+    assert 'mm_potential' not in wrapper.get_main_info()
+
+    assert not np.allclose(info['potential'], info['mm_potential'])
+    assert np.allclose(info['mm_potential'], state['potential'])
+    assert np.allclose(info['mm_gradients'], state['gradients'], atol=1e-06)
+
 def test_create_modeller():
     mod1 = wrapper_ala.create_modeller(atoms=[0,1,2,3], keep_atoms=True)
     mod2 = wrapper_ala.create_modeller(atoms=[0,1,2,3], keep_atoms=False)
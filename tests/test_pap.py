@@ -105,4 +105,6 @@ def test_run_qmmm():
     assert np.allclose(pap_2.systems[0]['qmmm_forces'][0], np.array([0.01083326, 0.04899138,-0.03727567] ))
     assert len(pap_1.systems[0]['qmmm_forces']) == 6
     assert len(pap_2.systems[0]['qmmm_forces']) == 9
+    assert pap_2.systems[0]['qm'].entire_sys is pap_2.systems[0][0].entire_sys
+    assert pap_2.systems[0]['qm'].entire_sys is pap_2.systems[0][2].entire_sys
 
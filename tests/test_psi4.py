@@ -5,6 +5,7 @@ from janus.qm_wrapper import Psi4Wrapper
 import mdtraj as md
 import numpy as np
 import os
+import gc
 from copy import deepcopy
 
 water = os.path.join(str('tests/files/test_openmm/water.pdb'))
@@ -91,14 +92,17 @@ def test_set_qm_geometry():
 
     qm_sys1.set_qm_geometry(qm_mol)
     assert qm_sys1.qm_geometry == qm_mol
+    assert qm_sys1.get_geom_string() == qm_mol
     
 def test_get_geom_from_trajectory():
     
     qm_sys2.get_geom_from_trajectory(qm_traj)
     qm_sys3.get_geom_from_trajectory(qm_traj)
     
-    assert qm_sys2.qm_geometry == qm_mol
-    assert qm_sys3.qm_geometry == qm_mol
+    assert qm_sys2.get_geom_string() == qm_mol
+    assert qm_sys3.get_geom_string() == qm_mol
+    assert np.allclose(qm_sys2.qm_xyz, qm_traj.xyz[0]*10)
+    assert np.array_equal(qm_sys2.qm_atomic_numbers, [8, 1, 1, 8, 1, 1])
     assert qm_sys1.is_open_shelled is False
 
 
@@ -142,6 +146,17 @@ def test_compute_scf_charges():
 
     assert np.allclose(qm_sys1.charges, charge1)
 
+def test_compute_info_charges():
+
+    result = qm_sys1.compute_info(charge_method='MULLIKEN_CHARGES')
+
+    charge1 = np.array([-0.3742676, 0.18533499, 0.18958095, -0.37355466, 0.18900526, 0.18390106])
+
+    assert np.allclose(result['energy'], -149.92882700815)
+    assert np.allclose(result['gradients'], gradient1)
+    assert np.allclose(result['charges'], charge1)
+    assert result['wavefunction'] is qm_sys1.wavefunction
+
 def test_compute_energy_and_charges():
 
     qm_sys2.compute_energy_and_charges()
@@ -178,4 +193,92 @@ def test_get_energy_and_gradient():
     assert np.allclose(info2['gradients'], gradient2)
     assert np.allclose(info3['gradients'], gradient3)
 
+def test_get_aspc_coefficients():
+
+    assert np.allclose(Psi4Wrapper.get_aspc_coefficients(0), [2.0, -1.0])
+    assert np.allclose(Psi4Wrapper.get_aspc_coefficients(1), [2.5, -2.0, 0.5])
+    assert np.allclose(Psi4Wrapper.get_aspc_coefficients(2), [2.8, -2.8, 1.2, -0.2])
+
+def test_reuse_guess():
+
+    qm_guess = Psi4Wrapper(reuse_guess=True, extrapolation_order=1, **config1)
+    atoms = [0,1,2,3,4,5]
+
+    info1 = qm_guess.get_energy_and_gradient(geometry=qm_mol, atoms=atoms)
+    info2 = qm_guess.get_energy_and_gradient(geometry=qm_mol, atoms=atoms)
+    info3 = qm_guess.get_energy_and_gradient(geometry=qm_mol, atoms=atoms)
+
+    assert len(qm_guess.guess_history[tuple(atoms)]['densities']) == 3
+    assert np.allclose(info1['energy'], -149.92882700815)
+    assert np.allclose(info2['energy'], -149.92882700815)
+    assert np.allclose(info3['energy'], -149.92882700815)
+    assert np.allclose(info3['gradients'], gradient1)
+
+    # order 0 reuses the last wavefunction, in the scratch directory when one is given
+    qm_last = Psi4Wrapper(reuse_guess=True, extrapolation_order=0, **config1)
+    qm_last.get_energy_and_gradient(geometry=qm_mol, atoms=atoms)
+    qm_last.get_energy_and_gradient(geometry=qm_mol, atoms=atoms)
+    info4 = qm_last.get_energy_and_gradient(geometry=qm_mol, atoms=atoms)
+    guess_dir = qm_last.guess_dir
+
+    assert np.allclose(info4['energy'], -149.92882700815)
+    assert guess_dir is not None and os.path.isdir(guess_dir)
+
+    del qm_last
+    gc.collect()
+    assert not os.path.isdir(guess_dir)
+
+def test_persistent_session():
+
+    qm_session = Psi4Wrapper(persistent_session=True, **config1)
+
+    info1 = qm_session.get_energy_and_gradient(geometry=qm_mol)
+    assert Psi4Wrapper.session_options == qm_session.qm_param
+
+    info2 = qm_session.get_energy_and_gradient(geometry=qm_mol)
+    info3 = qm_sys2.get_energy_and_gradient(traj=qm_traj, charges=charges)
+    assert Psi4Wrapper.session_options is None
+
+    info4 = qm_session.get_energy_and_gradient(geometry=qm_mol)
+
+    assert np.allclose(info1['energy'], -149.92882700815)
+    assert np.allclose(info2['energy'], -149.92882700815)
+    assert np.allclose(info3['energy'], -151.18483039002274)
+    assert np.allclose(info4['energy'], -149.92882700815)
+    assert np.allclose(info4['gradients'], gradient1)
+
+def test_cache(tmpdir):
+
+    qm_cache = Psi4Wrapper(cache_dir=str(tmpdir), **config1)
+    qm_cache.get_geom_from_trajectory(qm_traj)
+    qm_cache.external_charges = charges
+    key = qm_cache.get_cache_key()
+
+    assert qm_cache.load_cached_info(key) is False
+
+    qm_cache.energy, qm_cache.gradient, qm_cache.charges = -149.92882700815, gradient1, None
+    qm_cache.save_cached_info(key)
+    qm_cache.energy, qm_cache.gradient = None, None
+
+    assert qm_cache.load_cached_info(key) is True
+    assert np.allclose(qm_cache.energy, -149.92882700815)
+    assert np.allclose(qm_cache.gradient, gradient1)
+    assert qm_cache.charges is None
+    assert qm_cache.cache_info['hits'] == 1
+
+    # coordinates within the tolerance, a different basis, and different charges
+    qm_cache.qm_xyz[0,0] += 1e-7
+    assert qm_cache.get_cache_key() == key
+    assert qm_cache.get_cache_key(minimize=True) != key
+    qm_cache.external_charges = None
+    assert qm_cache.get_cache_key() != key
+    qm_basis = Psi4Wrapper(cache_dir=str(tmpdir), **config2)
+    qm_basis.get_geom_from_trajectory(qm_traj)
+    qm_basis.external_charges = charges
+    assert qm_basis.get_cache_key() != key
 
+    # least recently used results are removed
+    qm_cache.cache_size = 1e-6
+    qm_cache.save_cached_info(qm_cache.get_cache_key())
+    assert qm_cache.cache_info['evictions'] == 2
+    assert len(tmpdir.listdir()) == 0
@@ -0,0 +1,89 @@
+"""
+Testing for qm_executor.py module
+"""
+from janus.qm_wrapper import QMWrapper, QMExecutor
+import mdtraj as md
+import numpy as np
+import os
+
+water = os.path.join(str('tests/files/test_openmm/water.pdb'))
+traj = md.load(water)
+
+class HarmonicWrapper(QMWrapper):
+    """
+    QMWrapper with the energy of harmonic springs to the origin,
+    which records the process it was computed in
+    """
+
+    def __init__(self, k=1.0, charge=0):
+        super().__init__('Harmonic')
+        self.k = k
+        self.charge = charge
+
+    def compute_info(self):
+        self.energy = 0.5 * self.k * np.sum(self.qm_xyz**2)
+        if self.external_charges is not None:
+            self.energy += np.sum(self.external_charges[:,0])
+        self.gradient = self.k * self.qm_xyz
+        self.charges = np.array([os.getpid()])
+
+    def build_qm_param(self):
+        self.qm_param = {}
+
+    def optimize_geometry(self):
+        pass
+
+    def get_wrapper_param(self):
+        return {'k' : self.k, 'charge' : self.charge}
+
+def test_make_job():
+
+    executor = QMExecutor(1)
+    job = executor.make_job(HarmonicWrapper(k=2.0), traj.atom_slice([0,1,2]), charges=[[1.0, 0.0, 0.0, 0.0]], atoms=[0,1,2])
+    executor.close()
+
+    assert job['wrapper_class'] is HarmonicWrapper
+    assert job['wrapper_param'] == {'k' : 2.0, 'charge' : 0}
+    assert np.allclose(job['xyz'], traj.xyz[0][0:3]*10)
+    assert job['atomic_numbers'] == [8, 1, 1]
+    assert job['charges'].shape == (1, 4)
+
+def test_run():
+
+    executor = QMExecutor(2)
+    wrapper = HarmonicWrapper(k=2.0)
+    atoms = [[0,1,2], [3,4,5], [0,1,2,3,4,5]]
+    jobs = [executor.make_job(wrapper, traj.atom_slice(a), atoms=a) for a in atoms]
+    jobs.append(executor.make_job(wrapper, traj.atom_slice(atoms[0]), charges=np.array([[0.5, 0.0, 0.0, 0.0]]), atoms=atoms[0]))
+
+    info = executor.run(jobs)
+    executor.close()
+
+    for a, i in zip(atoms, info):
+        xyz = traj.xyz[0][a]*10
+        assert np.allclose(i['energy'], np.sum(xyz**2))
+        assert np.allclose(i['gradients'], 2.0*xyz)
+
+    assert np.allclose(info[3]['energy'], info[0]['energy'] + 0.5)
+    # computed in worker processes
+    assert all(i['charges'][0] != os.getpid() for i in info)
+
+def test_close(tmpdir):
+
+    with QMExecutor(2, scratch_dir=str(tmpdir)) as executor:
+        wrapper = HarmonicWrapper()
+        info = executor.run([executor.make_job(wrapper, traj.atom_slice([0,1,2]))])
+        scratch_root = executor.scratch_root
+        # one scratch directory for each worker that has started, the other may still be starting
+        assert 1 <= len(os.listdir(scratch_root)) <= 2
+
+    assert not os.path.isdir(scratch_root)
+    assert os.listdir(str(tmpdir)) == []
+    # closing again does nothing
+    executor.close()
+
+    # stopped when garbage collected without being closed
+    executor = QMExecutor(1, scratch_dir=str(tmpdir))
+    scratch_root = executor.scratch_root
+    del executor
+    assert not os.path.isdir(scratch_root)
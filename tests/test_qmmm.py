@@ -85,6 +85,90 @@ def test_get_external_charges():
     assert len(charges_ala_link) == 29
     assert len(charges_ala_RC) == 30
     assert len(charges_ala_RCD) == 31
+    assert charges_ala_link.shape == (29, 4)
+    assert charges_ala_RCD.dtype == np.float64
+
+    # the charge of each M1 atom is redistributed to the midpoints of its bonds to M2 atoms,
+    # after the charges of the other atoms
+    m1, m2 = ala_RC.link_atoms['all_mm'][0], ala_RC.link_atoms['all_outer_bonds'][0]
+    n_redistributed = sum(len(bonds) for bonds in ala_RC.link_atoms['all_outer_bonds'])
+    es_pos = 10 * sys_ala_RC.entire_sys['positions']
+    redistributed = charges_ala_RC[len(charges_ala_RC) - n_redistributed:][:len(m2)]
+
+    assert len(m2) > 0
+    assert np.allclose(redistributed[:, 0], ala_RC.get_main_charges()[m1] / len(m2))
+    assert np.allclose(redistributed[:, 1:], (es_pos[m2] + es_pos[m1]) / 2)
+
+def test_truncate_external_charges():
+
+    cutoff = qmmm.QMMM(psi4, om_m, sys_info=water, qm_atoms=[0,1,2], embedding_method='Electrostatic', embedding_cutoff=2.0)
+
+    full = elec.get_external_charges(sys_elec)
+    charges = cutoff.get_external_charges(sys_elec)
+    # the error is only computed if asked for
+    assert cutoff.embedding_error is None
+
+    cutoff.embedding_error_interval = 10
+    assert np.allclose(cutoff.get_external_charges(sys_elec), charges)
+
+    assert len(full) == 6
+    assert len(charges) == 4
+    # total charge and dipole are conserved
+    assert np.allclose(np.sum(charges[:,0]), np.sum(full[:,0]))
+    assert np.allclose(charges[:,0].dot(charges[:,1:]), full[:,0].dot(full[:,1:]))
+    assert cutoff.embedding_error['n_full'] == 6
+    assert cutoff.embedding_error['potential_max'] < 0.01
+    assert cutoff.embedding_error['potential_rms'] > 0.0
+
+def test_truncate_external_charges_outer_cutoff():
+
+    box = os.path.join(str('tests/files/test_openmm/input.pdb'))
+    outer = qmmm.QMMM(psi4, om_m, sys_info=box, embedding_cutoff=6.0, embedding_outer_cutoff=10.0)
+    no_outer = qmmm.QMMM(psi4, om_m, sys_info=box, embedding_cutoff=6.0)
+
+    # a water in the middle of the box is the QM region, the other waters are TIP3P charges
+    waters = [res for res in outer.topology.residues if res.name == 'HOH']
+    qm_atoms = [atom.index for atom in waters[len(waters)//2].atoms]
+    sys_box = system.System(qm_atoms, [0], 0)
+    sys_box.entire_sys = {'positions' : outer.positions}
+    mm_atoms = np.array([atom.index for res in waters for atom in res.atoms if atom.index not in qm_atoms])
+    mm_charges = np.array([-0.834 if outer.topology.atom(i).name == 'O' else 0.417 for i in mm_atoms])
+    mm_dist = np.linalg.norm(10*outer.positions[mm_atoms] - 10*outer.positions[qm_atoms[0]], axis=1)
+
+    # boxes of waters of increasing size around the QM water
+    n_sites, n_sites_no_outer = [], []
+    for radius in [12.0, 15.0, 18.0]:
+        residues = outer.get_atom_residues()[mm_atoms]
+        inside = np.isin(residues, residues[mm_dist < radius])
+        charges = np.column_stack([mm_charges[inside], 10*outer.positions[mm_atoms[inside]]])
+        n_sites.append(len(outer.truncate_external_charges(sys_box, charges, mm_atoms[inside])))
+        n_sites_no_outer.append(len(no_outer.truncate_external_charges(sys_box, charges, mm_atoms[inside])))
+
+    assert n_sites[0] == n_sites[1] == n_sites[2]
+    assert n_sites_no_outer[0] < n_sites_no_outer[1] < n_sites_no_outer[2]
+    assert n_sites[0] < n_sites_no_outer[0]
+
+def test_allocate_qm_resources():
+
+    psi4_res = qm_wrapper.Psi4Wrapper()
+    resources = qmmm.QMMM(psi4_res, om_m, sys_info=water, qm_atoms=[0,1,2], qm_resource_policy='auto',
+                          qm_total_threads=8, qm_total_memory=4000)
+    workers = qmmm.QMMM(psi4_res, om_m, sys_info=water, qm_atoms=[0,1,2], qm_resource_policy='auto',
+                        qm_total_threads=8, qm_total_memory=4000, qm_workers=2)
+
+    assert mech.allocate_qm_resources(3) is None
+
+    res = resources.allocate_qm_resources(3)
+    assert res['concurrent_jobs'] == 1
+    assert res['num_threads'] == 8
+    assert psi4_res.memory == 4000 * 1024**2
+
+    res = workers.allocate_qm_resources(3)
+    assert res['concurrent_jobs'] == 2
+    assert res['mm_threads'] == 1
+    assert psi4_res.num_threads == 3
+    assert psi4_res.memory == 2000 * 1024**2
+    assert psi4_res.get_wrapper_param()['num_threads'] == 3
 
 def test_make_primary_subsys_trajectory():
 
@@ -99,13 +183,50 @@ def test_make_primary_subsys_trajectory():
     assert len(traj_mech.xyz[0]) == 3
     assert len(traj_ala.xyz[0]) == 8
     
+def test_primary_subsys_cache():
+
+    ala_RC.subsys_cache.clear()
+    traj, link = ala_RC.make_primary_subsys_trajectory(qm_atoms=sys_ala_RC.qm_atoms)
+    traj_again, link_again = ala_RC.make_primary_subsys_trajectory(qm_atoms=list(reversed(sys_ala_RC.qm_atoms)))
+
+    assert len(ala_RC.subsys_cache) == 1
+    assert traj_again.topology is traj.topology
+    assert link_again == link
+    assert traj.topology.n_bonds == ala_RC.topology.subset(sys_ala_RC.qm_atoms).n_bonds + len(link)
+    for i in link:
+        assert traj.topology.atom(i).name == 'H1'
+
+    # coordinates are taken from the current positions
+    ala_RC.positions += 0.1
+    traj_moved, link_moved = ala_RC.make_primary_subsys_trajectory(qm_atoms=sys_ala_RC.qm_atoms)
+    ala_RC.positions -= 0.1
+
+    assert np.allclose(traj_moved.xyz, traj.xyz + 0.1)
+    assert np.allclose(ala_RC.link_atoms[0]['link_positions'], traj_moved.xyz[0][link[0]])
+
+def test_get_primary_subsys_atoms():
+
+    traj_ala, link_ala = ala_RC.make_primary_subsys_trajectory(qm_atoms=sys_ala_RC.qm_atoms)
+    atoms = ala_RC.get_primary_subsys_atoms(qm_atoms=sys_ala_RC.qm_atoms)
+
+    assert len(atoms) == traj_ala.n_atoms
+    assert atoms[:6] == [0,1,2,3,4,5]
+    assert atoms[link_ala[0]] == ala_RC.link_atoms[0]['mm_atom'].index
+    assert atoms[link_ala[1]] == ala_RC.link_atoms[1]['mm_atom'].index
+    
 def test_make_second_subsys_trajectory():
 
     traj_mech = mech.make_second_subsys_trajectory()
     traj_ala = ala_RC.make_second_subsys_trajectory(qm_atoms=sys_ala_RC.qm_atoms)
+    traj_ala_again = ala_RC.make_second_subsys_trajectory(qm_atoms=sys_ala_RC.qm_atoms)
     
     assert len(traj_mech.xyz[0]) ==6
     assert len(traj_ala.xyz[0]) == 27
+    assert ala_RC.mm_atoms == [i for i in range(33) if i not in sys_ala_RC.qm_atoms]
+    assert np.allclose(traj_ala.xyz[0], ala_RC.positions[ala_RC.mm_atoms])
+    # the topology is reused for the same QM atoms
+    assert traj_ala_again.topology is traj_ala.topology
+    assert np.allclose(traj_ala_again.xyz, traj_ala.xyz)
 
 
 def test_mechanical():
@@ -137,11 +258,33 @@ def test_electrostatic():
 def test_update_traj():
 
     mech.traj.xyz[0] = np.zeros((9,3))
+    traj = mech.traj
     pos1 = mech.traj.xyz[0]
     mech.update_traj(main_info_m['positions'], main_info_m['topology'], 'OpenMM')
-    
-    assert np.allclose(pos1, np.zeros((9,3)))
+    top = mech.topology
+
+    # the positions are updated in place
+    assert mech.traj is traj
+    assert np.allclose(pos1, main_info_m['positions'])
     assert np.allclose(mech.traj.xyz[0], main_info_m['positions'])
+
+    # the topology is only converted once
+    mech.update_traj(np.zeros((9,3)), main_info_m['topology'], 'OpenMM')
+    assert mech.topology is top
+    assert mech.topology.atom(0).serial == 1
+    assert np.allclose(mech.positions, np.zeros((9,3)))
+    mech.update_traj(main_info_m['positions'], main_info_m['topology'], 'OpenMM')
+    
+def test_get_entire_sys_info():
+    main = qmmm.QMMM(psi4, om_m, sys_info=water, qm_atoms=[0,1,2], use_main_info=True)
+
+    main_info_mm = om_m.get_main_info(include_mm=True)
+    entire_m = mech.get_entire_sys_info(main_info_m)
+    entire_main = main.get_entire_sys_info(main_info_mm)
+
+    assert np.allclose(entire_main['energy'], main_info_mm['mm_potential'])
+    assert np.allclose(entire_main['energy'], entire_m['energy'])
+    assert np.allclose(entire_main['gradients'], entire_m['gradients'], atol=1e-06)
     
 def test_run_qmmm():
     mech.qm_atoms = [0,1,2]
@@ -19,3 +19,24 @@ def test_compute_scale_factor_g():
 
 
         
+
+def test_force_buffer():
+
+    forces = system.ForceBuffer([5, 1, 3], [[5, 5, 5], [1, 1, 1], [3, 3, 3]])
+    from_dict = system.ForceBuffer.from_forces({3 : np.ones((1,3)), 7 : np.array([0, 0, 2])})
+
+    assert forces.keys() == [1, 3, 5]
+    assert np.allclose(forces[5], [5, 5, 5])
+    assert 3 in forces and 2 not in forces
+    assert system.ForceBuffer.from_forces(forces) is forces
+
+    total = forces.scaled(2.0)
+    total.add(from_dict, scale=-1.0)
+    total.set_forces([1, 9, 9], [[0, 0, 0], [1, 2, 3], [4, 5, 6]])
+
+    assert np.allclose(forces[5], [5, 5, 5])
+    assert total.keys() == [1, 3, 5, 7, 9]
+    assert np.allclose(total.forces, [[0, 0, 0], [5, 5, 5], [10, 10, 10], [0, 0, -2], [4, 5, 6]])
+
+    with pytest.raises(ValueError):
+        system.ForceBuffer([1, 1])